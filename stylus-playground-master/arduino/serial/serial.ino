@@ -4,11 +4,50 @@
 // D2/SDA -> green
 // D3/SCL -> white
 
+// Uncomment to send compact binary frames instead of text lines (see `script/protocol.py`)
+//#define BINARY_PROTOCOL
+
+#ifdef BINARY_PROTOCOL
+
+#define BAUD_RATE 230400
+#define SYNC 0xA55A
+
+// Little-endian, packed, 38 bytes
+struct __attribute__((packed)) Frame {
+  uint16_t sync;
+  uint16_t sequence;
+  uint32_t timestamp;
+  float ax, ay, az;
+  float gx, gy, gz;
+  float temperature;
+  uint16_t crc;
+};
+
+Frame frame;
+
+// CRC-16/CCITT-FALSE
+uint16_t crc16(const uint8_t *data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  while (length--) {
+    crc ^= (uint16_t)(*data++) << 8;
+    for (uint8_t i = 0; i < 8; ++i) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+#else
+
+#define BAUD_RATE 9600
+
+#endif
+
 Adafruit_LSM6DS3TRC lsm6ds3trc;
 
 void setup() {
 
-  Serial.begin(9600);
+  Serial.begin(BAUD_RATE);
   while (!Serial);
 
   if (!lsm6ds3trc.begin_I2C()) {
@@ -20,6 +59,14 @@ void setup() {
 
   //lsm6ds3trc.configInt1(false, false, true); // accelerometer DRDY on INT1
   //lsm6ds3trc.configInt2(false, true, false); // gyro DRDY on INT2
+
+#ifdef BINARY_PROTOCOL
+  // The link is fast enough to keep up with a higher output data rate
+  lsm6ds3trc.setAccelDataRate(LSM6DS_RATE_416_HZ);
+  lsm6ds3trc.setGyroDataRate(LSM6DS_RATE_416_HZ);
+  frame.sync = SYNC;
+  frame.sequence = 0;
+#endif
 }
 
 void loop() {
@@ -30,6 +77,22 @@ void loop() {
 
   lsm6ds3trc.getEvent(&accel, &gyro, &temp);
 
+#ifdef BINARY_PROTOCOL
+
+  frame.timestamp = gyro.timestamp;
+  frame.ax = accel.acceleration.x;
+  frame.ay = accel.acceleration.y;
+  frame.az = accel.acceleration.z;
+  frame.gx = gyro.gyro.x;
+  frame.gy = gyro.gyro.y;
+  frame.gz = gyro.gyro.z;
+  frame.temperature = temp.temperature;
+  frame.crc = crc16((const uint8_t *)&frame + 2, sizeof(Frame) - 4);
+  Serial.write((const uint8_t *)&frame, sizeof(Frame));
+  frame.sequence++;
+
+#else
+
   Serial.print(gyro.timestamp);
   Serial.print(",");
 
@@ -50,4 +113,6 @@ void loop() {
   Serial.println(temp.temperature);
   
   delay(5);
+
+#endif
 }
@@ -0,0 +1,315 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+# Benchmarks only need the recordings, no serial device and no display
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+import calibration
+import frames
+import integration
+import loader
+import madgwick
+import merge
+import pipeline
+import replay
+import resample
+from framer import Framer
+
+DATA_DIRECTORY = os.path.join(ROOT, "data")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A stage regresses if its throughput drops by more than this fraction, compared to the baseline, or by more than a
+# multiple of its relative interquartile range (in either run) if it is noisier
+DEFAULT_THRESHOLD = 0.2
+NOISE_FACTOR = 3.0
+
+# Baselines are only meaningful on the same setup (e.g. a baseline without Numba cannot show a Numba speedup)
+COMPARABLE = ("python", "numpy", "numba", "machine", "processor", "cpu_count", "workers")
+
+
+def find_pairs(directory):
+    """
+    Output:
+        list of `(imu, tablet)` paths, e.g. `sync_imu_2.csv` with `sync_tab_2.csv`
+    """
+    pairs = []
+    for imu in sorted(glob.glob(os.path.join(directory, "*_imu*.csv"))):
+        tablet = imu.replace("_imu", "_tab")
+        if os.path.exists(tablet):
+            pairs.append((imu, tablet))
+    return pairs
+
+
+def strokes(in_range):
+    """
+    Output:
+        (K, 2) array, start and stop index of each stroke (i.e. while the pen is in range)
+    """
+    in_range = np.concatenate([[False], np.asarray(in_range) != 0, [False]])
+    starts, = np.nonzero(in_range[1:] & ~in_range[:-1])
+    stops, = np.nonzero(~in_range[1:] & in_range[:-1])
+    return np.stack([starts, stops], axis=-1)
+
+
+class Dataset:
+    """
+    Recordings and intermediate results, computed once so that each stage is timed on its own.
+    """
+
+    def __init__(self, directory=DATA_DIRECTORY, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.paths = sorted(glob.glob(os.path.join(directory, "*.csv")))
+        self.pairs = find_pairs(directory)
+        self.imus = [loader.load(imu, cache=False) for imu, _ in self.pairs]
+        self.tablets = [loader.load(tablet, cache=False) for _, tablet in self.pairs]
+        self.merged = [merge.merge(imu, tablet) for imu, tablet in zip(self.imus, self.tablets)]
+
+        # Sensor values, as used by the pipeline
+        self.t = [data["arduino_timestamp"] * 1e-3 for data in self.merged]
+        self.acc = [np.stack([data[name] for name in ["ax", "ay", "az"]], axis=-1) for data in self.merged]
+        self.gyr = [np.stack([data[name] for name in ["gx", "gy", "gz"]], axis=-1) for data in self.merged]
+        self.q = [madgwick.estimate(g, a, np.diff(t, prepend=t[0])) for t, a, g in zip(self.t, self.acc, self.gyr)]
+        self.nav = [frames.linear_acceleration(q, a) for q, a in zip(self.q, self.acc)]
+        self.bounds = [strokes(data["in_range"]) for data in self.merged]
+
+        # Idle recording, in various orientations
+        idle = loader.load(os.path.join(directory, "calibrate_imu_idle.csv"), calibrate=False, cache=False)
+        self.idle_t = idle["arduino_timestamp"] * 1e-3
+        self.idle_acc = np.stack([idle[name] for name in ["ax", "ay", "az"]], axis=-1)
+        self.idle_gyr = np.stack([idle[name] for name in ["gx", "gy", "gz"]], axis=-1)
+
+        # Serial stream, as sent by the firmware in text mode
+        self.stream = b"".join(b"".join(replay.format_lines(loader.load(imu, calibrate=False, cache=False))) for imu, _ in self.pairs)
+
+
+# Each stage returns the number of samples it processed
+def bench_load(dataset):
+    return sum(loader.load(path, cache=False).shape[0] for path in dataset.paths)
+
+
+def bench_load_cached(dataset):
+
+    # Binary sidecars are written on first call, which is not timed
+    return sum(loader.load(path).shape[0] for path in dataset.paths)
+
+
+def bench_merge(dataset):
+    return sum(merge.merge(imu, tablet).shape[0] for imu, tablet in zip(dataset.imus, dataset.tablets))
+
+
+def bench_orientation(dataset):
+    for t, acc, gyr in zip(dataset.t, dataset.acc, dataset.gyr):
+        madgwick.estimate(gyr, acc, np.diff(t, prepend=t[0]))
+    return sum(t.shape[0] for t in dataset.t)
+
+
+def bench_frame(dataset):
+    for q, acc in zip(dataset.q, dataset.acc):
+        frames.linear_acceleration(q, acc)
+    return sum(q.shape[0] for q in dataset.q)
+
+
+def bench_integration(dataset):
+    for data, t, acc, gyr, nav in zip(dataset.merged, dataset.t, dataset.acc, dataset.gyr, dataset.nav):
+        mask = integration.zero_velocity(integration.stationary(acc, gyr))
+        mask |= integration.contact(touch=data["touch"])
+        integration.integrate(t, nav, mask)
+    return sum(t.shape[0] for t in dataset.t)
+
+
+def bench_resample(dataset):
+    count = 0
+    for data, bounds in zip(dataset.merged, dataset.bounds):
+        resample.resample(data, bounds, cache=None)
+        count += int((bounds[:, 1] - bounds[:, 0]).sum())
+    return count
+
+
+def bench_calibration(dataset):
+    calibration.calibrate(dataset.idle_t, dataset.idle_acc, dataset.idle_gyr)
+    return dataset.idle_t.shape[0]
+
+
+def bench_pipeline(dataset):
+
+    # All per-segment stages, in worker processes (including pool startup, as paid by every caller)
+    count = 0
+    for data, bounds in zip(dataset.merged, dataset.bounds):
+        columns = {name: data[name] for name in data.dtype.names}
+        pipeline.process(columns, bounds, processes=dataset.workers)
+        count += int((bounds[:, 1] - bounds[:, 0]).sum())
+    return count
+
+
+def bench_framer(dataset, chunk=64):
+
+    # Same steps as the serial readers, with bytes arriving in small chunks
+    framer = Framer(8)
+    correction = calibration.Calibration()
+    stream = memoryview(dataset.stream)
+    count = 0
+    for i in range(0, len(stream), chunk):
+        framer.feed(stream[i:i + chunk])
+        records = framer.parse(framer.pop())
+        correction.apply(records[:, 1:7], out=records[:, 1:7])
+        count += records.shape[0]
+    return count
+
+
+STAGES = {
+    "load": bench_load,
+    "load_cached": bench_load_cached,
+    "merge": bench_merge,
+    "orientation": bench_orientation,
+    "frame": bench_frame,
+    "integration": bench_integration,
+    "resample": bench_resample,
+    "calibration": bench_calibration,
+    "pipeline": bench_pipeline,
+    "framer": bench_framer,
+}
+
+
+def measure(function, dataset, repeat=7, min_time=0.1):
+    """
+    Input:
+        repeat: number of timed runs
+        min_time: minimal duration of a timed run, in seconds (short stages are called several times per run)
+
+    Output:
+        dictionary with number of samples, median time, spread, throughput and peak traced memory
+    """
+
+    # Calls per run, so that timer resolution and scheduling noise are small compared to a run
+    start = time.perf_counter()
+    samples = function(dataset)
+    number = max(int(np.ceil(min_time / max(time.perf_counter() - start, 1e-9))), 1)
+
+    # Median of the runs, with interquartile range as a measure of noise
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(dataset)
+        durations.append((time.perf_counter() - start) / number)
+    seconds = float(np.median(durations))
+    q1, q3 = np.percentile(durations, [25, 75])
+
+    # Memory is traced in a separate run, as tracing slows allocations down
+    tracemalloc.start()
+    function(dataset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "samples": samples,
+        "seconds": seconds,
+        "runs": repeat,
+        "number": number,
+        "spread": float((q3 - q1) / seconds) if seconds > 0 else 0.0,
+        "samples_per_second": samples / seconds if seconds > 0 else float("inf"),
+        "peak_memory": peak,
+    }
+
+
+def environment(workers):
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba_version,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+    }
+
+
+def tolerance(result, reference, threshold=DEFAULT_THRESHOLD):
+    """
+    Output:
+        tolerated throughput drop of a stage, as a fraction, widened for stages that were noisy in either run
+    """
+    return max(threshold, NOISE_FACTOR * max(result.get("spread", 0.0), reference.get("spread", 0.0)))
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Output:
+        list of `(stage, ratio, tolerance)` for stages slower than the baseline by more than their tolerance
+    """
+    regressions = []
+    for stage, result in results["stages"].items():
+        reference = baseline["stages"].get(stage)
+        if reference is None:
+            continue
+        ratio = result["samples_per_second"] / reference["samples_per_second"]
+        limit = tolerance(result, reference, threshold)
+        if ratio < 1.0 - limit:
+            regressions.append((stage, ratio, limit))
+    return regressions
+
+
+def differences(current, reference):
+    """
+    Output:
+        list of environment keys that differ from the baseline (e.g. `numba`, `cpu_count`)
+    """
+    return [key for key in COMPARABLE if current.get(key) != reference.get(key)]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark offline pipeline stages on recorded data")
+    parser.add_argument("stages", nargs="*", help=f"subset of {', '.join(STAGES)} (defaults to all)")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--repeat", type=int, default=7, help="number of timed runs, the median is reported")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimal duration of a timed run, in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes of the pipeline stage")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="minimal tolerated throughput drop, as a fraction")
+    parser.add_argument("--update-baseline", action="store_true", help="store results as the new baseline")
+    args = parser.parse_args()
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages {', '.join(unknown)}")
+
+    dataset = Dataset(workers=args.workers)
+    results = {"environment": environment(dataset.workers), "stages": {}}
+    for stage in args.stages or STAGES:
+        result = measure(STAGES[stage], dataset, args.repeat, args.min_time)
+        results["stages"][stage] = result
+        print(f"{stage:<12} {result['samples']:>8d} samples  {result['seconds'] * 1e3:9.2f} ms  iqr {result['spread'] * 100:4.1f}%  {result['samples_per_second']:12.0f} samples/s  {result['peak_memory'] / 2 ** 20:8.2f} MiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        sys.exit(0)
+
+    # Compare throughput with the stored baseline, if any
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        changed = differences(results["environment"], baseline.get("environment", {}))
+        if changed:
+            print(f"Warning: baseline was measured with a different {', '.join(changed)}, refresh it with --update-baseline")
+        regressions = compare(results, baseline, args.threshold)
+        for stage, ratio, limit in regressions:
+            print(f"Regression in {stage}: {ratio:.2f}x baseline throughput (tolerance {limit:.0%})")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,276 @@
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+
+
+# Calibration file, shared by loaders and live readers
+# Note: see `calibrate_imu_idle.ipynb` for the method, this is the same model
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "calibration.json")
+VERSION = 1
+
+# Without calibration, only convert acceleration to g
+STANDARD_GRAVITY = 9.81
+
+
+class Calibration:
+    """
+    Corrected accelerometer is `a * acc_scale + acc_offset` (in g), corrected gyroscope is `g + gyro_offset`.
+    """
+
+    def __init__(self, acc_scale=None, acc_offset=None, gyro_offset=None, metadata=None):
+        self.acc_scale = np.full(3, 1.0 / STANDARD_GRAVITY) if acc_scale is None else np.asarray(acc_scale, dtype=np.float64)
+        self.acc_offset = np.zeros(3) if acc_offset is None else np.asarray(acc_offset, dtype=np.float64)
+        self.gyro_offset = np.zeros(3) if gyro_offset is None else np.asarray(gyro_offset, dtype=np.float64)
+        self.metadata = metadata or {}
+
+        # Both sensors are corrected at once, as `[a, g] * gain + bias`
+        self.gain = np.concatenate([self.acc_scale, np.ones(3)])
+        self.bias = np.concatenate([self.acc_offset, self.gyro_offset])
+
+    def apply(self, values, out=None):
+        """
+        Input:
+            values: (..., 6) array, raw accelerometer and gyroscope samples (i.e. `ax, ay, az, gx, gy, gz`)
+            out: output array, can be `values` itself to correct in place (e.g. a view on parsed records)
+
+        Output:
+            (..., 6) array, corrected samples
+        """
+        out = np.multiply(values, self.gain, out=out)
+        out += self.bias
+        return out
+
+    def apply_columns(self, columns, names=("ax", "ay", "az", "gx", "gy", "gz")):
+        """
+        Correct columns of a mapping (e.g. DataFrame or structured array) in place.
+        """
+        gain = self.gain.astype(np.asarray(columns[names[0]]).dtype, copy=False)
+        bias = self.bias.astype(gain.dtype, copy=False)
+        for i, name in enumerate(names):
+            columns[name] = columns[name] * gain[i] + bias[i]
+        return columns
+
+    def to_json(self):
+        return {
+            "version": VERSION,
+            "acc_scale": self.acc_scale.tolist(),
+            "acc_offset": self.acc_offset.tolist(),
+            "gyro_offset": self.gyro_offset.tolist(),
+            **self.metadata,
+        }
+
+    def save(self, path=DEFAULT_PATH):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_json(), file, indent=4)
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != VERSION:
+            raise ValueError(f"Unsupported calibration version {data.get('version')}")
+        metadata = {key: value for key, value in data.items() if key not in ("version", "acc_scale", "acc_offset", "gyro_offset")}
+        return cls(data["acc_scale"], data["acc_offset"], data["gyro_offset"], metadata)
+
+
+def load(path=DEFAULT_PATH):
+    """
+    Output:
+        calibration stored in file, or nominal one if there is no such file
+    """
+    if not os.path.exists(path):
+        return Calibration()
+    with open(path, "r", encoding="utf-8") as file:
+        return Calibration.from_json(json.load(file))
+
+
+def running_std(x, window):
+    """
+    Input:
+        x: (N, ...) array
+        window: window size, in samples
+
+    Output:
+        (N - window + 1, ...) array, standard deviation of each window (same as `sliding_window_view(...).std(...)`)
+    """
+
+    # Work relative to the mean, to limit cancellation in the sum of squares
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x.mean(axis=0)
+    zero = np.zeros((1,) + x.shape[1:])
+    s1 = np.concatenate([zero, np.cumsum(x, axis=0)])
+    s2 = np.concatenate([zero, np.cumsum(x * x, axis=0)])
+    mean = (s1[window:] - s1[:-window]) / window
+    variance = (s2[window:] - s2[:-window]) / window - mean * mean
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def stationary_intervals(t, gyr, window, threshold=0.005, min_duration=2.0):
+    """
+    Input:
+        t: (N,) array, timestamps, in seconds
+        gyr: (N, 3) array, angular velocity
+        window: window size, in samples (e.g. one second)
+        threshold: maximal standard deviation of angular velocity, on every axis
+        min_duration: minimal duration of an interval, in seconds
+
+    Output:
+        starts: (K,) array, first index of each interval
+        ends: (K,) array, last index of each interval
+    """
+    n = gyr.shape[0]
+    if n < window:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Each window is associated with its center
+    is_stable = (running_std(gyr, window) < threshold).all(axis=1)
+    is_stable = np.pad(is_stable, [(window // 2, n - is_stable.shape[0] - window // 2)])
+
+    # Extract indices
+    indices = np.arange(1, n)
+    starts = indices[~is_stable[:-1] & is_stable[1:]]
+    ends = indices[is_stable[:-1] & ~is_stable[1:]]
+
+    # Remove short windows
+    is_meaningful = t[ends] - t[starts] >= min_duration
+    return starts[is_meaningful], ends[is_meaningful]
+
+
+class StationaryDetector:
+    """
+    Streaming equivalent of `stationary_intervals`, O(1) per sample.
+    """
+
+    def __init__(self, window, threshold=0.005, min_duration=2.0):
+        self.window = window
+        self.threshold = threshold
+        self.min_duration = min_duration
+        self.values = np.zeros((window, 3))
+        self.count = 0
+        self.s1 = np.zeros(3)
+        self.s2 = np.zeros(3)
+        self.start = None
+
+    def update(self, t, g):
+        """
+        Input:
+            t: timestamp, in seconds
+            g: angular velocity sample
+
+        Output:
+            whether the sensor has been stationary for at least `min_duration` (over the last window)
+        """
+
+        # Replace oldest sample in running sums
+        g = np.asarray(g, dtype=np.float64)
+        i = self.count % self.window
+        old = self.values[i]
+        self.s1 += g - old
+        self.s2 += g * g - old * old
+        self.values[i] = g
+        self.count += 1
+
+        # Recompute sums from time to time, to avoid accumulating rounding errors
+        if i == self.window - 1:
+            self.s1 = self.values.sum(axis=0)
+            self.s2 = (self.values * self.values).sum(axis=0)
+        if self.count < self.window:
+            return False
+
+        # Track start of current stationary interval
+        mean = self.s1 / self.window
+        std = np.sqrt(np.maximum(self.s2 / self.window - mean * mean, 0.0))
+        if (std < self.threshold).all():
+            if self.start is None:
+                self.start = t
+            return t - self.start >= self.min_duration
+        self.start = None
+        return False
+
+
+def fit_ellipsoid(points, iterations=10):
+    """
+    Input:
+        points: (K, 3) array, average accelerometer samples while stationary, in various orientations
+        iterations: number of Gauss-Newton refinement steps
+
+    Output:
+        scale: (3,) array
+        offset: (3,) array, such that `points * scale + offset` are unit vectors (as much as possible)
+    """
+    points = np.asarray(points, dtype=np.float64)
+
+    # Closed form, by solving `u . p^2 + v . p = 1` in the least squares sense (i.e. algebraic distance)
+    design = np.concatenate([points * points, points], axis=1)
+    solution, *_ = np.linalg.lstsq(design, np.ones(points.shape[0]), rcond=None)
+    u, v = solution[:3], solution[3:]
+    center = -v / (2.0 * u)
+    scale = np.sqrt(u / (1.0 + (u * center * center).sum()))
+    offset = -scale * center
+
+    # Refine using the geometric residual, `|p * scale + offset| - 1`, as in the notebook
+    for _ in range(iterations):
+        true = points * scale + offset
+        norm = np.linalg.norm(true, axis=1)
+        residual = norm - 1.0
+        direction = true / norm[:, None]
+        jacobian = np.concatenate([direction * points, direction], axis=1)
+        step, *_ = np.linalg.lstsq(jacobian, -residual, rcond=None)
+        scale += step[:3]
+        offset += step[3:]
+        if np.abs(step).max() < 1e-12:
+            break
+    return scale, offset
+
+
+def calibrate(t, acc, gyr, window=None, threshold=0.005, min_duration=2.0):
+    """
+    Input:
+        t: (N,) array, timestamps, in seconds
+        acc: (N, 3) array, raw accelerometer samples
+        gyr: (N, 3) array, raw gyroscope samples
+        window: window size, in samples, defaults to one second
+
+    Output:
+        `Calibration` object
+    """
+    if window is None:
+        window = int(1.0 / np.median(np.diff(t)))
+    starts, ends = stationary_intervals(t, gyr, window, threshold, min_duration)
+    if starts.shape[0] < 6:
+        raise RuntimeError(f"Only {starts.shape[0]} stationary intervals found, at least 6 orientations are needed")
+
+    # Aggregate intervals
+    acc_means = np.stack([acc[start:end].mean(axis=0) for start, end in zip(starts, ends)])
+    gyr_means = np.stack([gyr[start:end].mean(axis=0) for start, end in zip(starts, ends)])
+
+    # Gyroscope offset should not be affected by actual orientation
+    scale, offset = fit_ellipsoid(acc_means)
+    metadata = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "intervals": int(starts.shape[0]),
+    }
+    return Calibration(scale, offset, -gyr_means.mean(axis=0), metadata)
+
+
+if __name__ == "__main__":
+
+    # Expect a dump of the IMU, idle in various orientations
+    parser = argparse.ArgumentParser(description="Estimate IMU calibration from stationary intervals")
+    parser.add_argument("path", help="IMU dump, as written by `collect_imu.py`, or binary recording")
+    parser.add_argument("-o", "--output", default=DEFAULT_PATH)
+    parser.add_argument("--threshold", type=float, default=0.005)
+    parser.add_argument("--min-duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # Raw values are needed, whatever the current calibration
+    import loader
+    data = loader.load(args.path, calibrate=False)
+    t = data["arduino_timestamp"] * 1e-3
+    acc = np.stack([data[name] for name in ["ax", "ay", "az"]], axis=-1)
+    gyr = np.stack([data[name] for name in ["gx", "gy", "gz"]], axis=-1)
+    calibration = calibrate(t, acc, gyr, threshold=args.threshold, min_duration=args.min_duration)
+    calibration.metadata["source"] = os.path.basename(args.path)
+    calibration.save(args.output)
+    print(json.dumps(calibration.to_json(), indent=4))
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import contextlib
+from dataclasses import dataclass
+import time
+
+import numpy as np
+
+import pyglet
+
+import serial
+from serial.tools.list_ports import comports
+
+import protocol
+from clock import ClockSync
+from framer import Framer
+from merge import MERGED_DTYPE, Merger
+from recording import IMU_DTYPE, TABLET_DTYPE, Recorder
+from tablet import find_tablet, to_window
+
+
+# Single process, single event loop, single clock, single file:
+#  - the serial port is read in a worker thread (blocking read with timeout), and parsed in the loop
+#  - pyglet events are pumped by a coroutine, instead of `pyglet.app.run`
+#  - both streams are stamped with `time.perf_counter_ns`, and written to the same recording
+
+
+@dataclass
+class TabletState:
+    timestamp: int = 0
+    x: float = 0.0
+    y: float = 0.0
+    z: float = 0.0
+    in_range: int = 0
+    touch: int = 0
+    pressure: float = 0.0
+    reset: int = 0
+    changed: bool = False
+
+
+class Capture:
+    def __init__(self, recorder, port=None, binary=False, tablet=True, merge=False):
+        self.recorder = recorder
+        self.port = port
+        self.binary = binary
+        self.tablet = tablet
+        self.running = False
+        self.counts = {"imu": 0, "tablet": 0}
+
+        # Optionally, also write IMU rows augmented with tablet state, as soon as possible
+        self.merger = Merger() if merge else None
+
+    def append(self, stream, columns):
+        self.recorder.append(stream, columns)
+        if self.merger is not None:
+            if stream == "imu":
+                merged = self.merger.push_imu(columns)
+            else:
+                merged = self.merger.push_tablet(columns)
+            if merged.shape[0] > 0:
+                self.recorder.append("merged", merged)
+
+    async def run_imu(self):
+        loop = asyncio.get_running_loop()
+        baud_rate = protocol.BINARY_BAUD_RATE if self.binary else protocol.ASCII_BAUD_RATE
+        framer = Framer(8)
+        buffer = bytearray()
+        clock = ClockSync()
+        with serial.Serial(self.port, baud_rate, timeout=0.1) as port:
+            while self.running:
+
+                # Wait for at least one byte, then take whatever is available
+                data = await loop.run_in_executor(None, port.read, max(port.in_waiting, 1))
+                timestamp = time.perf_counter_ns()
+                if not data:
+                    continue
+
+                # Decode every complete record at once
+                if self.binary:
+                    buffer += data
+                    frames, consumed = protocol.decode(buffer)
+                    del buffer[:consumed]
+                    columns = {name: frames[name] for name in protocol.COLUMNS}
+                else:
+                    framer.feed(data)
+                    records = framer.parse(framer.pop())
+                    columns = {name: records[:, i] for i, name in enumerate(protocol.COLUMNS)}
+                device = columns["arduino_timestamp"]
+                if len(device) == 0:
+                    continue
+
+                # All records of a chunk share the same host timestamp, the last one being the most accurate
+                clock.update(int(device[-1]), timestamp)
+                columns["host_timestamp"] = timestamp
+                columns["timestamp"] = clock.correct(device)
+                self.append("imu", columns)
+                self.counts["imu"] += len(columns["ax"])
+
+    async def run_tablet(self, interval=0.005):
+        device, controls = find_tablet()
+        window = pyglet.window.Window(1020, 576, caption="Capture", resizable=True)
+        device.open(window)
+        state = TabletState()
+
+        # Stamp every change as soon as it is dispatched
+        def make_handler(key, convert):
+            def on_change(value):
+                setattr(state, key, convert(value))
+                state.timestamp = time.perf_counter_ns()
+                state.changed = True
+            return on_change
+
+        for key, convert in [("x", float), ("y", float), ("z", float), ("in_range", int), ("touch", int), ("pressure", float)]:
+            controls[key].push_handlers(on_change=make_handler(key, convert))
+
+        @window.event
+        def on_key_press(symbol, modifiers):
+
+            # Use space bar to mark the end of a segment
+            if symbol == pyglet.window.key.SPACE:
+                state.reset = 1
+                state.timestamp = time.perf_counter_ns()
+                state.changed = True
+
+        @window.event
+        def on_draw():
+            window.clear()
+
+        # Pump events from the shared event loop
+        while self.running and not window.has_exit:
+            pyglet.clock.tick()
+            window.dispatch_events()
+
+            # One row per dispatch, if anything changed
+            if state.changed:
+                x, y = to_window(window, state.x, state.y)
+                values = (state.timestamp, x, y, state.z, state.in_range, state.touch, state.pressure, state.reset)
+                self.append("tablet", np.array([values], dtype=TABLET_DTYPE))
+                self.counts["tablet"] += 1
+                state.changed = False
+                state.reset = 0
+
+            window.dispatch_event("on_draw")
+            window.flip()
+            await asyncio.sleep(interval)
+
+        # Closing the window stops the capture
+        self.running = False
+        window.close()
+
+    async def run_status(self, interval=1.0):
+        while self.running:
+            await asyncio.sleep(interval)
+
+            # Flush on time, even if a stream is idle
+            self.recorder.maybe_flush()
+            print(f"imu: {self.counts['imu']}, tablet: {self.counts['tablet']}", end="\r", flush=True)
+
+    async def run(self):
+        self.running = True
+        tasks = [self.run_status()]
+        if self.port is not None:
+            tasks.append(self.run_imu())
+        if self.tablet:
+            tasks.append(self.run_tablet())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.running = False
+
+
+if __name__ == "__main__":
+
+    # Expect an (optional) port name and an output file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", nargs="?")
+    parser.add_argument("-o", "--output", required=True, help="session recording, with `imu` and `tablet` streams")
+    parser.add_argument("--binary", action="store_true", help="expect binary frames (see `protocol.py`)")
+    parser.add_argument("--no-imu", action="store_true")
+    parser.add_argument("--no-tablet", action="store_true")
+    parser.add_argument("--merge", action="store_true", help="also write a `merged` stream (see `merge.py`)")
+    args = parser.parse_args()
+
+    # Default to the first available port
+    if args.port is None and not args.no_imu:
+        info = comports()[0]
+        args.port = info.device
+    if args.no_imu:
+        args.port = None
+
+    # Recording is closed properly, even on Ctrl+C
+    streams = {"imu": IMU_DTYPE, "tablet": TABLET_DTYPE}
+    if args.merge:
+        streams["merged"] = MERGED_DTYPE
+    with Recorder(args.output, streams) as recorder, contextlib.suppress(KeyboardInterrupt):
+        capture = Capture(recorder, args.port, binary=args.binary, tablet=not args.no_tablet, merge=args.merge)
+        asyncio.run(capture.run())
@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import calibration
+import loader
+import recording
+
+
+# Manifest is stored in the indexed directory, and only rebuilt for files that changed
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+MANIFEST = "catalog.json"
+VERSION = 1
+
+EXTENSIONS = (".csv", ".rec")
+
+
+def _median_rate(timestamps, unit):
+    steps = np.diff(np.asarray(timestamps, dtype=np.float64))
+    steps = steps[steps > 0]
+    return float(unit / np.median(steps)) if steps.shape[0] > 0 else 0.0
+
+
+def index_recording(path):
+    """
+    Input:
+        path: CSV dump or binary recording
+
+    Output:
+        dictionary, summary of the recording (see `Catalog`)
+    """
+    data = loader.load(path, calibrate=False)
+    stat = os.stat(path)
+    t = data["host_timestamp"]
+    entry = {
+        "file": os.path.basename(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "kind": "imu" if "arduino_timestamp" in data.dtype.names else "tablet",
+        "rows": int(data.shape[0]),
+        "start": int(t[0]) if t.shape[0] > 0 else 0,
+        "end": int(t[-1]) if t.shape[0] > 0 else 0,
+        "sample_rate": _median_rate(t, 1e9),
+    }
+    if entry["kind"] == "imu":
+        entry["device_rate"] = _median_rate(data["arduino_timestamp"], 1e3)
+        return entry
+
+    # Sentences are delimited by resets (i.e. space bar)
+    resets, = np.nonzero(data["reset"] != 0)
+    entry["resets"] = resets.tolist()
+    entry["reset_times"] = t[resets].astype(np.int64).tolist()
+
+    # Strokes start when the pen enters range (or on reset while in range), and stop when it leaves
+    in_range = data["in_range"] != 0
+    entering = in_range & ~np.concatenate([[False], in_range[:-1]])
+    entering |= in_range & (data["reset"] != 0)
+    starts, = np.nonzero(entering)
+    leaving, = np.nonzero(~in_range & np.concatenate([[False], in_range[:-1]]))
+    stops = np.concatenate([starts[1:], [data.shape[0]]])
+    if leaving.shape[0] > 0:
+        following = np.searchsorted(leaving, starts, side="right")
+        has_leaving = following < leaving.shape[0]
+        stops = np.where(has_leaving, np.minimum(stops, leaving[np.minimum(following, leaving.shape[0] - 1)]), stops)
+    entry["in_range_starts"] = starts.tolist()
+    entry["in_range_stops"] = stops.tolist()
+    entry["in_range_start_times"] = t[starts].astype(np.int64).tolist()
+    entry["in_range_stop_times"] = t[np.maximum(stops - 1, 0)].astype(np.int64).tolist() if stops.shape[0] > 0 else []
+    return entry
+
+
+def _session_name(file):
+    stem = os.path.splitext(file)[0]
+    for suffix in ("_tab", "_imu"):
+        if suffix in stem:
+            return stem.replace(suffix, "", 1)
+    return stem
+
+
+class Catalog:
+    """
+    Index of all recordings of a directory, with sentence (i.e. reset) and stroke (i.e. in range) boundaries.
+
+    Sessions are named after the tablet file (without `_tab`), and paired with the IMU file that overlaps the most.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(self.directory, MANIFEST)
+        self.entries = {}
+        self.sessions = {}
+
+        # Raw rows of each file, memory-mapped once cached (see `loader.load`)
+        self.arrays = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest.get("version") == VERSION:
+                self.entries = manifest["entries"]
+                self.sessions = manifest["sessions"]
+
+    def save(self):
+        manifest = {"version": VERSION, "entries": self.entries, "sessions": self.sessions}
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temporary, self.path)
+
+    def scan(self):
+        """
+        Index new or modified files, and forget removed ones.
+        """
+        entries = {}
+        for file in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, file)
+            if not file.endswith(EXTENSIONS) or not os.path.isfile(path):
+                continue
+            if file.endswith(".rec") and not recording.is_recording(path):
+                continue
+            stat = os.stat(path)
+            entry = self.entries.get(file)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                try:
+                    entry = index_recording(path)
+                except ValueError:
+                    continue
+            entries[file] = entry
+        self.entries = entries
+        self.arrays = {}
+        self.pair()
+        self.save()
+        return self
+
+    def pair(self):
+
+        # Keep existing offsets (e.g. estimated lag), if the pairing did not change
+        previous = self.sessions
+        self.sessions = {}
+        imus = [file for file, entry in self.entries.items() if entry["kind"] == "imu"]
+        for file, entry in self.entries.items():
+            if entry["kind"] != "tablet":
+                continue
+            overlaps = [min(entry["end"], self.entries[imu]["end"]) - max(entry["start"], self.entries[imu]["start"]) for imu in imus]
+            best = int(np.argmax(overlaps)) if overlaps else -1
+            session = {"tablet": file, "imu": imus[best] if best >= 0 and overlaps[best] > 0 else None}
+            name = _session_name(file)
+            if name in self.sessions:
+                name = os.path.splitext(file)[0]
+            old = previous.get(name, {})
+            if old.get("tablet") == session["tablet"] and old.get("imu") == session["imu"]:
+                session.update({key: old[key] for key in ("offset", "lag_score") if key in old})
+            self.sessions[name] = session
+
+    def tablet(self, session):
+        return self.entries[self.sessions[session]["tablet"]]
+
+    def array(self, file):
+        """
+        Output:
+            structured array, raw rows of a file (without calibration)
+        """
+        data = self.arrays.get(file)
+        if data is None:
+            data = self.arrays[file] = loader.load(os.path.join(self.directory, file), calibrate=False)
+        return data
+
+    def bounds(self, session, kind="reset"):
+        """
+        Input:
+            session: session name
+            kind: either `reset` (sentences) or `in_range` (strokes)
+
+        Output:
+            starts: (K,) array, host timestamp at the start of each segment
+            stops: (K,) array, host timestamp at the end of each segment
+        """
+        entry = self.tablet(session)
+        if kind == "reset":
+            times = np.asarray(entry["reset_times"], dtype=np.int64)
+            return times[:-1], times[1:]
+        return np.asarray(entry["in_range_start_times"], dtype=np.int64), np.asarray(entry["in_range_stop_times"], dtype=np.int64)
+
+    def rows(self, session, index, kind="reset"):
+        """
+        Output:
+            slice of tablet rows of a single segment
+        """
+        entry = self.tablet(session)
+        if kind == "reset":
+            return slice(entry["resets"][index], entry["resets"][index + 1])
+        return slice(entry["in_range_starts"][index], entry["in_range_stops"][index])
+
+    def segment(self, session, index, kind="reset", calibrate=True):
+        """
+        Input:
+            session: session name (e.g. `helloworld`)
+            index: segment index
+            kind: either `reset` (sentences) or `in_range` (strokes)
+            calibrate: apply IMU calibration (see `calibration.py`), or calibration object to use
+
+        Output:
+            dictionary with `tablet` rows and, if paired, `imu` rows of the segment
+        """
+        result = {}
+        info = self.sessions[session]
+        result["tablet"] = self.array(info["tablet"])[self.rows(session, index, kind)]
+
+        # IMU rows are found by corrected time, shifted by the estimated lag if any (see `lag.py`)
+        if info["imu"] is not None:
+            starts, stops = self.bounds(session, kind)
+            imu = self.array(info["imu"])
+            offset = info.get("offset", 0)
+            lo, hi = np.searchsorted(imu["timestamp"], [starts[index] + offset, stops[index] + offset])
+            imu = imu[lo:hi]
+
+            # Only the segment is calibrated
+            if calibrate is not False:
+                if calibrate is True:
+                    calibrate = calibration.load()
+                imu = calibrate.apply_columns(np.array(imu))
+            result["imu"] = imu
+        return result
+
+    def between(self, t0, t1, kind="reset"):
+        """
+        Input:
+            t0: first host timestamp, in nanoseconds
+            t1: last host timestamp, in nanoseconds
+
+        Output:
+            list of `(session, index)` of segments overlapping the interval
+        """
+        result = []
+        for session in self.sessions:
+            starts, stops = self.bounds(session, kind)
+            lo = np.searchsorted(stops, t0, side="right")
+            hi = np.searchsorted(starts, t1, side="left")
+            result.extend((session, index) for index in range(lo, hi))
+        return result
+
+
+if __name__ == "__main__":
+
+    # Show summary of a data directory
+    parser = argparse.ArgumentParser(description="Index recordings of a directory")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DIRECTORY)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.directory).scan()
+    for name, session in catalog.sessions.items():
+        entry = catalog.tablet(name)
+        duration = (entry["end"] - entry["start"]) * 1e-9
+        sentences = max(len(entry["resets"]) - 1, 0)
+        strokes = len(entry["in_range_starts"])
+        print(f"{name}: {duration:.1f} s, {sentences} sentences, {strokes} strokes, tablet {session['tablet']}, IMU {session['imu']}")
@@ -0,0 +1,189 @@
+import numpy as np
+
+
+# Host timestamps are taken when a line is received, so they include a variable transmission and processing delay
+# (USB polling, OS scheduling, Python). This delay is always positive, hence the samples that arrived the fastest lie
+# on the lower envelope of (device time, host time) pairs. Fitting a line on this envelope gives a mapping from the
+# (regular) device clock to the host clock, with both offset and drift, without the jitter.
+#
+# Note: the minimal delay itself cannot be observed, so corrected timestamps are still late by a constant amount
+
+
+class ClockSync:
+    """
+    Online estimator, O(1) per sample.
+
+    Device time is split in windows, the fastest sample of each window is an envelope point, and envelope points are
+    fitted using exponentially-weighted least squares (i.e. older windows are progressively forgotten).
+    """
+
+    def __init__(self, window=1000, forgetting=0.98):
+
+        # Window duration, in device time units (i.e. milliseconds)
+        self.window = window
+        self.forgetting = forgetting
+        self.reset()
+
+    def reset(self):
+
+        # Local origin, to keep values small
+        self.device_origin = None
+        self.host_origin = None
+        self.last_device = None
+
+        # Current window minimum
+        self.window_index = None
+        self.window_x = 0.0
+        self.window_r = np.inf
+
+        # Weighted sums for least squares
+        self.sw = 0.0
+        self.sx = 0.0
+        self.sr = 0.0
+        self.sxx = 0.0
+        self.sxr = 0.0
+
+        # Model is `r = offset + slope * x`, with `x` the elapsed device time and `r` the delay, both in ns
+        self.offset = 0.0
+        self.slope = 0.0
+
+    def update(self, device, host):
+        """
+        Input:
+            device: device timestamp, in milliseconds
+            host: host timestamp, in nanoseconds
+
+        Output:
+            corrected host timestamp, in nanoseconds
+        """
+
+        # Start over if the device was restarted
+        if self.last_device is not None and device < self.last_device:
+            self.reset()
+        self.last_device = device
+        if self.device_origin is None:
+            self.device_origin = device
+            self.host_origin = host
+            self.offset = 0.0
+
+        # Residual, relative to a perfect clock
+        x = (device - self.device_origin) * 1e6
+        r = (host - self.host_origin) - x
+
+        # Close window, and add its minimum to the fit
+        index = (device - self.device_origin) // self.window
+        if index != self.window_index:
+            if self.window_index is not None:
+                self.add(self.window_x, self.window_r)
+            self.window_index = index
+            self.window_r = np.inf
+
+        # Keep fastest sample of the window
+        if r < self.window_r:
+            self.window_x = x
+            self.window_r = r
+
+            # Until a line can be fitted, just use the lowest delay
+            if self.sw < 2.0 and r < self.offset:
+                self.offset = r
+
+        return self.correct(device)
+
+    def add(self, x, r):
+        f = self.forgetting
+        self.sw = f * self.sw + 1.0
+        self.sx = f * self.sx + x
+        self.sr = f * self.sr + r
+        self.sxx = f * self.sxx + x * x
+        self.sxr = f * self.sxr + x * r
+
+        # Solve 2x2 normal equations, once there is enough spread
+        det = self.sw * self.sxx - self.sx * self.sx
+        if self.sw >= 2.0 and det > 0.0:
+            self.slope = (self.sw * self.sxr - self.sx * self.sr) / det
+            self.offset = (self.sr - self.slope * self.sx) / self.sw
+
+    def correct(self, device):
+        """
+        Map device timestamps (scalar or array, in milliseconds) to host timestamps (in nanoseconds).
+        """
+        x = (np.asarray(device, dtype=np.float64) - self.device_origin) * 1e6
+        corrected = self.host_origin + np.rint(x + self.offset + self.slope * x).astype(np.int64)
+        return corrected if corrected.ndim > 0 else int(corrected)
+
+
+def envelope(device, host, window=1000):
+    """
+    Input:
+        device: device timestamps, in milliseconds
+        host: host timestamps, in nanoseconds
+        window: window duration, in milliseconds
+
+    Output:
+        indices of the fastest sample of each window
+    """
+    device = np.asarray(device, dtype=np.int64)
+    host = np.asarray(host, dtype=np.int64)
+    x = (device - device[0]) * 1_000_000
+    r = (host - host[0]) - x
+
+    # Sort by window, then by residual, and keep the first of each window
+    windows = (device - device[0]) // window
+    order = np.lexsort((r, windows))
+    is_first = np.ones(order.shape[0], dtype=bool)
+    is_first[1:] = windows[order[1:]] != windows[order[:-1]]
+    return np.sort(order[is_first])
+
+
+def synchronize(device, host, window=1000, iterations=3):
+    """
+    Batch version, over a whole recording.
+
+    Input:
+        device: device timestamps, in milliseconds (e.g. `arduino_timestamp` column)
+        host: host timestamps, in nanoseconds (e.g. `host_timestamp` column)
+        window: window duration, in milliseconds
+        iterations: number of outlier rejection passes
+
+    Output:
+        corrected host timestamps, in nanoseconds
+    """
+    device = np.asarray(device, dtype=np.int64)
+    host = np.asarray(host, dtype=np.int64)
+    if device.shape[0] == 0:
+        return host.copy()
+
+    # Each device restart is handled separately
+    starts, = np.nonzero(np.diff(device) < 0)
+    if starts.shape[0] > 0:
+        bounds = np.concatenate([[0], starts + 1, [device.shape[0]]])
+        return np.concatenate([
+            synchronize(device[a:b], host[a:b], window, iterations)
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ])
+
+    # Work relative to the first sample
+    x = (device - device[0]) * 1e6
+    r = (host - host[0]) - x
+
+    # Fit lower envelope
+    indices = envelope(device, host, window)
+    xs = x[indices]
+    rs = r[indices]
+    if indices.shape[0] < 2:
+        slope, offset = 0.0, rs.min()
+    else:
+        keep = np.ones(indices.shape[0], dtype=bool)
+        for _ in range(iterations):
+            slope, offset = np.polyfit(xs[keep], rs[keep], 1)
+
+            # Reject envelope points that are clearly above the line (i.e. windows without any fast sample)
+            error = rs - (offset + slope * xs)
+            scale = 1.4826 * np.median(np.abs(error[keep])) + 1.0
+            keep = error < 3.0 * scale
+            if keep.sum() < 2:
+                break
+
+    # Move line down to the lowest envelope point, so that no sample arrives before it was sent
+    offset += (rs - (offset + slope * xs)).min()
+    return host[0] + np.rint(x + offset + slope * x).astype(np.int64)
@@ -1,9 +1,13 @@
 import argparse
+import contextlib
 import time
 
 import serial
 from serial.tools.list_ports import comports
 
+import protocol
+from clock import ClockSync
+from recording import IMU_DTYPE, Recorder
 from util import no_interrupt
 
 
@@ -12,6 +16,8 @@ if __name__ == "__main__":
     # Expect an (optional) port name as argument
     parser = argparse.ArgumentParser()
     parser.add_argument("port", nargs="?")
+    parser.add_argument("--binary", action="store_true", help="expect binary frames (see `protocol.py`)")
+    parser.add_argument("-o", "--output", help="write a binary recording (see `recording.py`), instead of CSV to stdout")
     args = parser.parse_args()
 
     # Default to the first available port
@@ -19,26 +25,83 @@ if __name__ == "__main__":
         info = comports()[0]
         args.port = info.device
 
+    # Recording is closed properly, even on Ctrl+C
+    recorder = Recorder(args.output, {"imu": IMU_DTYPE}) if args.output else None
+
     # Open serial port, according to the Arduino parameters
-    with serial.Serial(args.port, 9600, timeout=1) as port:
+    baud_rate = protocol.BINARY_BAUD_RATE if args.binary else protocol.ASCII_BAUD_RATE
+    with serial.Serial(args.port, baud_rate, timeout=1) as port, recorder or contextlib.nullcontext():
 
         # Drop first line, in case it was partially read before
-        port.readline()
+        # Note: in binary mode, partial frames are dropped by the decoder
+        if not args.binary:
+            port.readline()
 
         # Print CSV header
-        print("host_timestamp,arduino_timestamp,ax,ay,az,gx,gy,gz,temperature")
+        # Note: `timestamp` is the host timestamp, corrected using the device clock
+        if recorder is None:
+            print("host_timestamp,arduino_timestamp,ax,ay,az,gx,gy,gz,temperature,timestamp")
+
+        # Estimate mapping from device clock to host clock, on the fly
+        clock = ClockSync()
 
         # Run forever
-        while True:
+        buffer = bytearray()
+        with contextlib.suppress(KeyboardInterrupt):
+            while True:
+
+                # Text mode, fetch a single line
+                if not args.binary:
+                    line = port.readline()
+
+                    # Use the most precise clock available
+                    # Note: this is system-wide, so another process will use the same reference, whatever that is
+                    timestamp = time.perf_counter_ns()
+
+                    # Skip malformed lines (e.g. truncated or corrupted by noise on the wire)
+                    try:
+                        line = line.decode("ascii").rstrip()
+                        values = line.split(",")
+                        if len(values) != 8:
+                            continue
+                        device = int(values[0])
+                        measures = [float(value) for value in values[1:]]
+                    except (UnicodeDecodeError, ValueError):
+                        continue
+                    corrected = clock.update(device, timestamp)
+
+                    # Store as binary row
+                    if recorder is not None:
+                        recorder.append_row("imu", (timestamp, device, *measures, corrected))
+                        continue
+
+                    # Write without interruption
+                    line = str(timestamp) + "," + line + "," + str(corrected)
+                    with no_interrupt():
+                        print(line)
+                    continue
+
+                # Binary mode, fetch whatever is available (at least one frame)
+                buffer += port.read(max(port.in_waiting, protocol.FRAME_SIZE))
+                timestamp = time.perf_counter_ns()
 
-            # Fetch a single line
-            line = port.readline()
+                # Decode all complete frames at once
+                frames, consumed = protocol.decode(buffer)
+                del buffer[:consumed]
+                if frames.shape[0] == 0:
+                    continue
 
-            # Use the most precise clock available
-            # Note: this is system-wide, so another process will use the same reference, whatever that is
-            timestamp = time.perf_counter_ns()
+                # All frames of a chunk share the same host timestamp, the last one being the most accurate
+                clock.update(int(frames["arduino_timestamp"][-1]), timestamp)
+                corrected = clock.correct(frames["arduino_timestamp"])
+                if recorder is not None:
+                    columns = {name: frames[name] for name in protocol.COLUMNS}
+                    recorder.append("imu", {**columns, "host_timestamp": timestamp, "timestamp": corrected})
+                    continue
 
-            # Write without interruption
-            line = str(timestamp) + "," + line.decode("ascii").rstrip()
-            with no_interrupt():
-                print(line)
+                lines = [
+                    f"{timestamp},{f['arduino_timestamp']},{f['ax']:.4f},{f['ay']:.4f},{f['az']:.4f},{f['gx']:.4f},{f['gy']:.4f},{f['gz']:.4f},{f['temperature']:.2f},{c}"
+                    for f, c in zip(frames, corrected)
+                ]
+                with no_interrupt():
+                    print("\n".join(lines))
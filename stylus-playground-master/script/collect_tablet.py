@@ -1,39 +1,27 @@
+import argparse
+import contextlib
 from dataclasses import dataclass
 import math
 import time
 
 import pyglet
 
+from recording import TABLET_DTYPE, Recorder
+from strokes import Strokes
+from tablet import EventLog, find_tablet, states, to_window
 from util import no_interrupt
 
 
-# Enumerate input devices
-# TODO pyglet's tablet objects seem to provide less details, but I may be wrong...
-devices = pyglet.input.get_devices()
-for device in devices:
+# Expect an (optional) output file as argument
+parser = argparse.ArgumentParser()
+parser.add_argument("-o", "--output", help="write a binary recording (see `recording.py`), instead of CSV to stdout")
+parser.add_argument("--events", action="store_true", help="one row per control change, instead of sampling at 100Hz")
+args = parser.parse_args()
+recorder = Recorder(args.output, {"tablet": TABLET_DTYPE}) if args.output else None
 
-    # Search by name
-    if device.name == "Wacom Tablet":
 
-        # The tablet appears twice, we need the one that has more information
-        # TODO better way to check for that?
-        controls = device.get_controls()
-        if len(controls) == 17:
-            break
-
-else:
-    raise RuntimeError("Wacom tablet not found")
-
-
-# Get tablet axes
-control_map = {control.raw_name: control for control in controls}
-print(list(control_map))
-control_x = control_map["X Axis"]
-control_y = control_map["Y Axis"]
-control_z = control_map["Z Axis"]
-control_in_range = control_map["In Range"]
-control_switch = control_map["Tip Switch"]
-control_pressure = control_map["Tip Pressure"]
+# Find tablet, whatever the driver language
+device, controls = find_tablet()
 
 
 # Open window
@@ -53,7 +41,7 @@ class State:
     y: int
     z: int
     in_range: int
-    switch: int
+    touch: int
     pressure: int
     reset: int
 
@@ -64,41 +52,31 @@ state = State(0, 0, 0, 0, 0, 0, 0)
 
 # Rendering stuff
 batch = pyglet.graphics.Batch()
-circles = []
-lines = []
-is_drawing = False
-old_x = 0
-old_y = 0
-
-
-@control_x.event
-def on_change(value):
-    state.x = value
+strokes = Strokes(batch)
+last_row = None
 
 
-@control_y.event
-def on_change(value):
-    state.y = value
+# Every change is logged with its own timestamp, and rows are derived from the log when needed (see `tablet.states`)
+# Note: planar coordinates are converted right away, since each one only depends on the window location
+log = EventLog()
 
 
-@control_z.event
-def on_change(value):
-    state.z = value
+def make_handler(key, convert):
+    def on_change(value):
 
+        # Use the same system-wide clock as `collect_imu.py`
+        timestamp = time.perf_counter_ns()
+        setattr(state, key, convert(value))
+        if key == "x":
+            value, _ = to_window(window, value, 0)
+        elif key == "y":
+            _, value = to_window(window, 0, value)
+        log.append(key, value, timestamp)
+    return on_change
 
-@control_in_range.event
-def on_change(value):
-    state.in_range = int(value)
 
-
-@control_switch.event
-def on_change(value):
-    state.switch = int(value)
-
-
-@control_pressure.event
-def on_change(value):
-    state.pressure = value
+for key, convert in [("x", float), ("y", float), ("z", float), ("in_range", int), ("touch", int), ("pressure", float)]:
+    controls[key].push_handlers(on_change=make_handler(key, convert))
 
 
 @window.event
@@ -137,6 +115,7 @@ def on_key_press(symbol, modifiers):
     # Use space bar to reset screen
     if symbol == pyglet.window.key.SPACE:
         state.reset = 1
+        log.append("reset", 1, time.perf_counter_ns())
 
 
 @window.event
@@ -151,70 +130,74 @@ def on_draw():
 
 
 # Print CSV header
-print("host_timestamp,x,y,z,in_range,touch,pressure,reset")
+if recorder is None:
+    print("host_timestamp,x,y,z,in_range,touch,pressure,reset")
 
 
 def on_tick(dt):
-    global is_drawing, old_x, old_y
+    global last_row
 
     # Use the same system-wide clock as `collect_imu.py`
     timestamp = time.perf_counter_ns()
-    
+
     # Planar coordinates are in normalized screen space (i.e. both X and Y are in [0, 65535], regardless of screen resolution)
-    # Note: make sure to enable Force Proportion in Wacom Tablet Properties!
-    window_x, window_y = window.get_location()
-    window_width, window_height = window.size
-    screen_width = window.screen.width
-    screen_height = window.screen.height
-    true_x = state.x / 65535 * screen_width - window_x
-    true_y = window_height - state.y / 65535 * screen_height + window_y
+    true_x, true_y = to_window(window, state.x, state.y)
+
+    # Output every change since last tick, continuing from the last row
+    if args.events:
+        rows = states(log.view(), initial=last_row)
+        if len(rows) > 0:
+            last_row = rows[-1]
+            if recorder is not None:
+                recorder.append("tablet", {name: rows[name] for name in TABLET_DTYPE.names})
+            else:
+                text = "\n".join(",".join(map(str, row.tolist())) for row in rows)
+                with no_interrupt():
+                    print(text)
 
     # Output sampled signal
-    values = (
-        timestamp,
-        true_x,
-        true_y,
-        state.z,
-        state.in_range,
-        state.switch,
-        state.pressure,
-        state.reset,
-    )
-    with no_interrupt():
-        print(",".join(map(str, values)))
-
-    # Only draw a line if there was a change
-    if is_drawing and (true_x != old_x or true_y != old_y):
-        line = pyglet.shapes.Line(old_x, old_y, true_x, true_y, color=(255, 255, 255, 255), batch=batch)
-        lines.append(line)
+    else:
+        values = (
+            timestamp,
+            true_x,
+            true_y,
+            state.z,
+            state.in_range,
+            state.touch,
+            state.pressure,
+            state.reset,
+        )
+        if recorder is not None:
+            recorder.append_row("tablet", values)
+        else:
+            with no_interrupt():
+                print(",".join(map(str, values)))
+    log.clear()
+
+    # Extend current stroke, if any
+    strokes.update(true_x, true_y)
 
     # Start drawing on touch
-    if not is_drawing and state.switch:
-        circle = pyglet.shapes.Circle(true_x, true_y, 5, color=(255, 255, 255, 255), batch=batch)
-        circles.append(circle)
-        is_drawing = True
+    if not strokes.is_drawing and state.touch:
+        strokes.begin(true_x, true_y)
 
     # Stop drawing if left button is released
-    if not state.switch:
-        is_drawing = False
+    if not state.touch:
+        strokes.end()
 
     # Reset also clears the screen
     if state.reset:
-        is_drawing = False
-        lines.clear()
-        circles.clear()
-
-    # Update state
-    old_x = true_x
-    old_y = true_y
+        strokes.clear()
     state.reset = 0
 
 
 # Try to run at 100Hz
-# Note: in practice, it will be slower than that
+# Note: in practice, it will be slower than that, which only delays output in event mode
 sample_rate = 100
 pyglet.clock.schedule_interval(on_tick, 1 / sample_rate)
 
 
 # Let pyglet handle the main loop
-pyglet.app.run()
+# Note: recording is closed properly, even on Ctrl+C
+with recorder or contextlib.nullcontext(), contextlib.suppress(KeyboardInterrupt):
+    pyglet.app.run()
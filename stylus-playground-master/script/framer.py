@@ -0,0 +1,139 @@
+import warnings
+
+import numpy as np
+
+
+# Map line endings to separators, so that a whole block can be parsed in a single call
+# Note: carriage returns are whitespace, which NumPy ignores around separators
+_TRANSLATION = bytes.maketrans(b"\n", b",")
+
+
+def _fromstring(data):
+
+    # Depending on NumPy version, unmatched data is either an error or a warning (with partial result)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return np.fromstring(data.translate(_TRANSLATION), sep=",")
+    except ValueError:
+        return None
+
+
+class Framer:
+    """
+    Incremental splitter for text records received in arbitrary chunks (e.g. from a serial port).
+
+    Bytes are appended to a single `bytearray`, complete records are handed out as a `memoryview`,
+    and only the unfinished tail is moved back to the front, when space is needed.
+    """
+
+    def __init__(self, columns, capacity=1 << 16, delimiter=b"\n", skip_first=True):
+        self.columns = columns
+        self.delimiter = delimiter
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+        # The first record is likely to be partial, if the device was already sending
+        self.skip_first = skip_first
+
+        # Parsed records, reused across calls
+        self.records = np.empty((256, columns))
+
+        # Number of records that could not be parsed
+        self.dropped = 0
+
+    def reserve(self, size):
+        if self.end + size <= len(self.buffer):
+            return
+
+        # Grow if needed, otherwise just move the pending tail to the front
+        pending = self.end - self.start
+        if pending + size > len(self.buffer):
+            buffer = bytearray(max(2 * len(self.buffer), pending + size))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        else:
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = pending
+
+    def feed(self, data):
+        size = len(data)
+        self.reserve(size)
+        self.view[self.end:self.end + size] = data
+        self.end += size
+
+    def read(self, port):
+        """
+        Read whatever is pending on the (non-blocking) port, without intermediate copy.
+        """
+        available = port.in_waiting
+        if available > 0:
+            self.reserve(available)
+            self.end += port.readinto(self.view[self.end:self.end + available])
+        return available
+
+    def pop(self):
+        """
+        Get all complete records received so far, as a single block.
+
+        Note: the returned view is only valid until the next call to `feed` or `read`.
+        """
+        index = self.buffer.rfind(self.delimiter, self.start, self.end)
+        if index < 0:
+            return self.view[0:0]
+        start = self.start
+        self.start = index + len(self.delimiter)
+
+        # Drop partial record, if any
+        if self.skip_first:
+            self.skip_first = False
+            start = self.buffer.find(self.delimiter, start, self.end) + len(self.delimiter)
+
+        # Rewind when empty, to avoid moving data later on
+        block = self.view[start:self.start]
+        if self.start == self.end:
+            self.start = self.end = 0
+        return block
+
+    def parse(self, block):
+        """
+        Convert a block of comma-separated records to a `(N, columns)` float array.
+
+        Note: the returned array is only valid until the next call to `parse`.
+        """
+        data = block.tobytes()
+        count = data.count(self.delimiter)
+        if count == 0:
+            return self.records[:0]
+
+        # Fast path, parse all records at once
+        values = _fromstring(data)
+
+        # Slow path, some records are malformed, so skip them individually
+        if values is None or values.shape[0] != count * self.columns:
+            rows = []
+            for line in data.split(self.delimiter)[:count]:
+                row = _fromstring(line)
+                if row is not None and row.shape[0] == self.columns:
+                    rows.append(row)
+            self.dropped += count - len(rows)
+            count = len(rows)
+            values = np.concatenate(rows) if rows else np.zeros(0)
+
+        # Copy into preallocated storage
+        if count > self.records.shape[0]:
+            self.records = np.empty((max(count, 2 * self.records.shape[0]), self.columns))
+        records = self.records[:count]
+        records.flat = values
+        return records
+
+    def update(self, port):
+        """
+        Read pending bytes and parse all complete records, in one step.
+        """
+        self.read(port)
+        return self.parse(self.pop())
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+# Navigation frame is Z-up, so that gravity is `(0, 0, 1)` when acceleration is expressed in g (see calibration)
+GRAVITY = np.array([0.0, 0.0, 1.0])
+
+
+def rotation_matrix(q):
+    """
+    Input:
+        q: (..., 4) array, quaternions (w, x, y, z), as returned by the Madgwick filter (not necessarily normalized)
+
+    Output:
+        (..., 3, 3) array, rotation matrices from body (i.e. sensor) frame to navigation frame
+    """
+    q = np.asarray(q, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    # Fill all entries at once, row by row
+    r = np.empty(q.shape[:-1] + (3, 3))
+    r[..., 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    r[..., 0, 1] = 2.0 * (x * y - w * z)
+    r[..., 0, 2] = 2.0 * (x * z + w * y)
+    r[..., 1, 0] = 2.0 * (x * y + w * z)
+    r[..., 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    r[..., 1, 2] = 2.0 * (y * z - w * x)
+    r[..., 2, 0] = 2.0 * (x * z - w * y)
+    r[..., 2, 1] = 2.0 * (y * z + w * x)
+    r[..., 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return r
+
+
+def to_navigation(r, v):
+    """
+    Input:
+        r: (..., 3, 3) array, rotation matrices, as returned by `rotation_matrix`
+        v: (..., 3) array, vectors in body frame
+
+    Output:
+        (..., 3) array, vectors in navigation frame
+    """
+    return np.einsum("...ij,...j->...i", r, v)
+
+
+def to_body(r, v):
+    """
+    Inverse of `to_navigation`, i.e. rotation matrices are transposed.
+    """
+    return np.einsum("...ji,...j->...i", r, v)
+
+
+def linear_acceleration(q, acc, gravity=GRAVITY):
+    """
+    Input:
+        q: (..., 4) array, quaternions (w, x, y, z)
+        acc: (..., 3) array, acceleration in body frame, including gravity
+        gravity: gravity in navigation frame, in the same unit as `acc` (e.g. `(0, 0, 9.81)` for m/s^2)
+
+    Output:
+        (..., 3) array, acceleration in navigation frame, without gravity
+    """
+    return to_navigation(rotation_matrix(q), acc) - gravity
+
+
+def add_navigation_columns(
+    data,
+    quaternion_columns=("q0", "q1", "q2", "q3"),
+    columns=("ax", "ay", "az"),
+    prefix="nav_",
+    gravity=GRAVITY,
+):
+    """
+    Input:
+        data: DataFrame (or any mutable mapping of columns), with quaternion and body frame acceleration columns
+        quaternion_columns: names of the quaternion columns
+        columns: names of the acceleration columns
+        prefix: prefix of the new columns (e.g. `nav_ax`)
+        gravity: gravity to remove, in navigation frame, use zero to keep it
+
+    Output:
+        same object, with one float column per navigation frame axis
+    """
+    q = np.stack([np.asarray(data[name], dtype=np.float64) for name in quaternion_columns], axis=-1)
+    acc = np.stack([np.asarray(data[name], dtype=np.float64) for name in columns], axis=-1)
+    nav = linear_acceleration(q, acc, gravity)
+    for i, name in enumerate(columns):
+        data[prefix + name] = nav[..., i]
+    return data
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import numpy as np
+
+import serial
+
+import calibration
+import madgwick
+from framer import Framer
+from ring import RingBuffer
+
+
+# Latest state, as published by the worker
+# Note: `host_timestamp` is the `time.perf_counter_ns` stamp of the serial read that received the sample
+STATE_COLUMNS = ("timestamp", "qw", "qx", "qy", "qz", "ax", "ay", "az", "host_timestamp")
+
+
+class Filter:
+    """
+    Madgwick filter, fed with batches of samples, with the same result as one sample at a time.
+    """
+
+    def __init__(self, gain=madgwick.DEFAULT_GAIN, gyro_scale=1.0):
+        self.gain = gain
+        self.gyro_scale = gyro_scale
+        self.t = None
+        self.q = np.array([1.0, 0.0, 0.0, 0.0])
+
+    def update(self, t, acc, gyr):
+        """
+        Input:
+            t: (N,) array, device timestamps, in seconds
+            acc: (N, 3) array, acceleration (any unit)
+            gyr: (N, 3) array, angular velocity, in rad/s (multiplied by `gyro_scale` for other units)
+
+        Output:
+            (N, 4) array, quaternions (w, x, y, z) after each sample
+        """
+        gyr = gyr * self.gyro_scale
+
+        # If this is the first batch, roughly estimate orientation using gravity only
+        if self.t is None:
+            q = madgwick.estimate(gyr, acc, np.diff(t, prepend=t[0]), gain=self.gain)
+
+        # Otherwise, continue from previous orientation, using a placeholder sample (which is not filtered)
+        else:
+            gyr = np.concatenate([np.zeros((1, 3)), gyr])
+            acc = np.concatenate([np.zeros((1, 3)), acc])
+            dt = np.diff(t, prepend=self.t)
+            q = madgwick.estimate(gyr, acc, np.concatenate([[0.0], dt]), self.q, self.gain)[1:]
+        self.t = t[-1]
+        self.q = q[-1]
+        return q
+
+
+class Fusion:
+    """
+    Serial port reader and orientation filter, running in a background thread.
+
+    Readers only see the latest state, through a double buffer: the worker writes the back buffer, then swaps. A
+    sequence number, odd while the worker writes, lets readers detect a copy that overlapped two swaps and retry.
+    Every sample is also handed over as `(timestamp, quaternion)` through a ring buffer, for consumers that need
+    the whole history (e.g. a trail). Counters are only written by the worker, and can be read at any time.
+    """
+
+    def __init__(self, port, baud_rate=9600, gain=madgwick.DEFAULT_GAIN, gyro_scale=1.0, capacity=4096, tracer=None):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.abort = False
+        self.thread = None
+        self.framer = Framer(8)
+        self.calibration = calibration.load()
+        self.tracer = tracer
+
+        # Filter state, only touched by the worker
+        self.filter = Filter(gain, gyro_scale)
+
+        # Published state
+        # Note: until the first sample, orientation is identity and acceleration is gravity
+        self.buffers = np.zeros((2, len(STATE_COLUMNS)))
+        self.buffers[:, 1] = 1.0
+        self.buffers[:, 7] = 1.0
+        self.front = 0
+        self.sequence = 0
+        self.poses = RingBuffer(capacity, 5)
+
+        # Counters
+        self.samples = 0
+        self.batches = 0
+        self.backlog = 0
+        self.duration = 0.0
+        self.busy = 0.0
+
+    def open(self):
+        assert self.thread is None
+        self.abort = False
+        self.thread = threading.Thread(target=self.run, name="Fusion", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.abort = True
+        self.thread.join()
+        self.thread = None
+
+    def latest(self):
+        """
+        Output:
+            (9,) array, see `STATE_COLUMNS`
+
+        Note: the worker may swap twice between reading `front` and copying, so the copy is retried unless the
+        sequence number shows at most one complete write meanwhile (which only touches the other buffer)
+        """
+        while True:
+            sequence = self.sequence
+            state = self.buffers[self.front].copy()
+            if sequence % 2 == 0 and self.sequence - sequence <= 2:
+                return state
+
+    def counters(self):
+        return {
+            "samples": self.samples,
+            "batches": self.batches,
+            "backlog": self.backlog,
+            "dropped": self.framer.dropped + self.poses.dropped,
+            "duration": self.duration,
+            "busy": self.busy,
+        }
+
+    def run(self):
+        with serial.Serial(self.port, self.baud_rate, timeout=0.1) as port:
+            while not self.abort:
+
+                # Read directly into the framer, or wait for at least one byte
+                if self.framer.read(port) == 0:
+                    self.framer.feed(port.read(1))
+                stamp = time.perf_counter_ns()
+                records = self.framer.parse(self.framer.pop())
+                if records.shape[0] == 0:
+                    continue
+                if self.tracer is not None:
+                    self.tracer.record("parse", stamp, records.shape[0])
+
+                # Whatever arrived meanwhile is handled on next iteration, as a single batch
+                start = time.perf_counter()
+                self.update(records, stamp)
+                self.duration = time.perf_counter() - start
+                if self.tracer is not None:
+                    self.tracer.record("filter", stamp, records.shape[0])
+                self.busy += self.duration
+                self.backlog = port.in_waiting
+                self.samples += records.shape[0]
+                self.batches += 1
+
+    def update(self, records, stamp=0):
+        """
+        Input:
+            records: (N, 8) array, parsed lines (Arduino timestamp, acceleration, angular velocity, temperature)
+            stamp: host timestamp of the serial read, in nanoseconds
+        """
+
+        # Correct both sensors in place, acceleration is then in g
+        self.calibration.apply(records[:, 1:7], out=records[:, 1:7])
+        t = records[:, 0] * 1e-3
+        q = self.filter.update(t, records[:, 1:4], records[:, 4:7])
+
+        # Hand over history
+        poses = np.empty((t.shape[0], 5))
+        poses[:, 0] = t
+        poses[:, 1:5] = q
+        self.poses.extend(poses)
+
+        # Write back buffer, then swap
+        back = 1 - self.front
+        self.sequence += 1
+        self.buffers[back, 0] = t[-1]
+        self.buffers[back, 1:5] = q[-1]
+        self.buffers[back, 5:8] = records[-1, 1:4]
+        self.buffers[back, 8] = stamp
+        self.front = back
+        self.sequence += 1
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.close()
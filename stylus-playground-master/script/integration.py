@@ -0,0 +1,174 @@
+import numpy as np
+
+
+def cumulative_trapezoid(t, x, initial=0.0):
+    """
+    Input:
+        t: (N,) array, timestamps
+        x: (N, ...) array, values to integrate along the first axis
+        initial: value at the first sample
+
+    Output:
+        (N, ...) array, same as repeated trapezoidal rule, e.g. `y[i] = y[i - 1] + (x[i - 1] + x[i]) / 2 * dt`
+    """
+    t = np.asarray(t, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.empty(x.shape)
+    if x.shape[0] == 0:
+        return y
+    dt = np.diff(t).reshape((-1,) + (1,) * (x.ndim - 1))
+    y[0] = initial
+    np.cumsum((x[1:] + x[:-1]) * 0.5 * dt, axis=0, out=y[1:])
+    y[1:] += initial
+    return y
+
+
+def moving_average(x, window):
+    """
+    Centered moving average along the first axis, using cumulative sums (i.e. O(N) whatever the window).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[0]
+    half = window // 2
+    padded = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+    lo = np.clip(np.arange(n) - half, 0, n)
+    hi = np.clip(np.arange(n) + half + 1, 0, n)
+    count = (hi - lo).reshape((-1,) + (1,) * (x.ndim - 1))
+    return (padded[hi] - padded[lo]) / count
+
+
+def stationary(acc, gyr, window=25, gyr_threshold=0.05, acc_threshold=0.02, gravity=1.0):
+    """
+    Input:
+        acc: (N, 3) array, acceleration in body frame, including gravity (in g by default)
+        gyr: (N, 3) array, angular velocity, in rad/s
+        window: smoothing window, in samples
+        gyr_threshold: maximal average angular velocity norm, in rad/s
+        acc_threshold: maximal average deviation of the acceleration norm from gravity
+        gravity: gravity norm, in the same unit as `acc`
+
+    Output:
+        (N,) boolean array, true when the pen is (most likely) not moving
+    """
+    gyr_norm = np.linalg.norm(gyr, axis=-1)
+    acc_error = np.abs(np.linalg.norm(acc, axis=-1) - gravity)
+    return (moving_average(gyr_norm, window) < gyr_threshold) & (moving_average(acc_error, window) < acc_threshold)
+
+
+def zero_velocity(mask):
+    """
+    Input:
+        mask: (N,) or (N, 3) boolean array, true when velocity is known to be zero (per axis, or on all of them)
+
+    Output:
+        (N, 3) boolean array
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = np.repeat(mask[:, None], 3, axis=1)
+    return mask
+
+
+def contact(touch=None, pressure=None, threshold=0.0):
+    """
+    Input:
+        touch: (N,) array, tablet tip switch
+        pressure: (N,) array, tablet tip pressure
+
+    Output:
+        (N, 3) boolean array, only vertical velocity is zero when the pen is on the tablet
+    """
+    mask = np.zeros(len(touch if touch is not None else pressure), dtype=bool)
+    if touch is not None:
+        mask |= np.asarray(touch) > 0
+    if pressure is not None:
+        mask |= np.asarray(pressure) > threshold
+    result = np.zeros((mask.shape[0], 3), dtype=bool)
+    result[:, 2] = mask
+    return result
+
+
+def _velocity_1d(t, v, mask):
+
+    # Last and next zero-velocity sample, for each sample
+    n = v.shape[0]
+    indices = np.arange(n)
+    last = np.maximum.accumulate(np.where(mask, indices, -1))
+    following = np.minimum.accumulate(np.where(mask, indices, n)[::-1])[::-1]
+
+    # Restart from zero after each zero-velocity sample
+    result = v - np.where(last >= 0, v[np.maximum(last, 0)], 0.0)
+
+    # Between two zero-velocity samples, remaining error at the end is assumed to grow linearly
+    is_bounded = (last >= 0) & (following < n)
+    start = np.maximum(last, 0)
+    end = np.minimum(following, n - 1)
+    error = v[end] - v[start]
+    duration = t[end] - t[start]
+    ratio = np.divide(t - t[start], duration, out=np.zeros(n), where=duration > 0)
+    result -= np.where(is_bounded, error * ratio, 0.0)
+    result[mask] = 0.0
+    return result
+
+
+def velocity(t, acc, mask=None):
+    """
+    Input:
+        t: (N,) array, timestamps, in seconds
+        acc: (N, 3) array, acceleration in navigation frame, without gravity
+        mask: (N,) or (N, 3) boolean array, zero-velocity samples (see `stationary` and `contact`)
+
+    Output:
+        (N, 3) array, velocity in navigation frame
+    """
+    t = np.asarray(t, dtype=np.float64)
+    v = cumulative_trapezoid(t, acc)
+    if mask is None:
+        return v
+    mask = zero_velocity(mask)
+    return np.stack([_velocity_1d(t, v[:, i], mask[:, i]) for i in range(3)], axis=-1)
+
+
+def anchor(t, p, indices, positions):
+    """
+    Input:
+        t: (N,) array, timestamps
+        p: (N, 3) array, integrated positions
+        indices: (K,) array, samples where position is known (e.g. pen on tablet)
+        positions: (K, 3) array, known positions, in the same unit as `p` (NaN if unknown on an axis)
+
+    Output:
+        (N, 3) array, positions with error interpolated linearly between anchors (and held constant outside)
+    """
+    t = np.asarray(t, dtype=np.float64)
+    p = np.array(p, dtype=np.float64)
+    indices = np.asarray(indices)
+    positions = np.asarray(positions, dtype=np.float64)
+    for i in range(p.shape[1]):
+        is_known = np.isfinite(positions[:, i])
+        if not is_known.any():
+            continue
+        error = p[indices[is_known], i] - positions[is_known, i]
+        p[:, i] -= np.interp(t, t[indices[is_known]], error)
+    return p
+
+
+def integrate(t, acc, mask=None, p0=None, anchor_indices=None, anchor_positions=None):
+    """
+    Input:
+        t: (N,) array, timestamps, in seconds
+        acc: (N, 3) array, acceleration in navigation frame, without gravity
+        mask: (N,) or (N, 3) boolean array, zero-velocity samples
+        p0: (3,) array, initial position
+        anchor_indices: (K,) array, samples where position is known
+        anchor_positions: (K, 3) array, known positions
+
+    Output:
+        velocity: (N, 3) array
+        position: (N, 3) array
+    """
+    v = velocity(t, acc, mask)
+    p = cumulative_trapezoid(t, v, 0.0 if p0 is None else np.asarray(p0, dtype=np.float64))
+    if anchor_indices is not None and len(anchor_indices) > 0:
+        p = anchor(t, p, anchor_indices, anchor_positions)
+    return v, p
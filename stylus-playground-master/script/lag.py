@@ -0,0 +1,169 @@
+import argparse
+
+import numpy as np
+
+import loader
+
+
+# Pen taps are visible on both sides: as a pressure onset on the tablet, and as a shock on the accelerometer. Both
+# signals are turned into onset detectors, sampled on a common grid, and cross-correlated around taps only.
+
+# Below this correlation score, the peak is most likely spurious (e.g. too few taps), and the lag is not applied
+DEFAULT_MIN_SCORE = 0.4
+
+
+def _normalize(x, mask):
+    x = np.where(mask, x, 0.0)
+    if mask.any():
+        x = np.where(mask, x - x[mask].mean(), 0.0)
+        std = x[mask].std()
+        if std > 0.0:
+            x /= std
+    return x
+
+
+def tap_regions(t, pressure, grid, margin=0.3):
+    """
+    Input:
+        t: (N,) array, tablet timestamps, in seconds
+        pressure: (N,) array, tablet pressure
+        grid: (M,) array, common time grid, in seconds
+        margin: duration around each tap, in seconds
+
+    Output:
+        (M,) boolean array, true around pressure onsets
+    """
+    is_pressed = np.asarray(pressure) > 0
+    onsets = t[1:][is_pressed[1:] & ~is_pressed[:-1]]
+
+    # Mark grid points close to an onset, using prefix sums of +1/-1 at region boundaries
+    lo = np.searchsorted(grid, onsets - margin)
+    hi = np.searchsorted(grid, onsets + margin)
+    counts = np.zeros(grid.shape[0] + 1, dtype=np.int64)
+    np.add.at(counts, lo, 1)
+    np.add.at(counts, hi, -1)
+    return np.cumsum(counts[:-1]) > 0
+
+
+def cross_correlation(a, b, max_lag):
+    """
+    Input:
+        a: (M,) array
+        b: (M,) array
+        max_lag: maximal lag, in samples
+
+    Output:
+        lags: (2 * max_lag + 1,) array, in samples
+        values: correlation of `a[i + lag]` with `b[i]`, for each lag
+    """
+    n = a.shape[0] + b.shape[0]
+    size = 1 << int(np.ceil(np.log2(max(n, 2))))
+    spectrum = np.fft.rfft(a, size) * np.conj(np.fft.rfft(b, size))
+    values = np.fft.irfft(spectrum, size)
+    lags = np.arange(-max_lag, max_lag + 1)
+    return lags, values[lags % size]
+
+
+def refine(values, i):
+    """
+    Sub-sample location of a peak, by fitting a parabola on three points.
+    """
+    if i <= 0 or i >= values.shape[0] - 1:
+        return float(i)
+    left, center, right = values[i - 1], values[i], values[i + 1]
+    denominator = left - 2.0 * center + right
+    if denominator >= 0.0:
+        return float(i)
+    return i + 0.5 * (left - right) / denominator
+
+
+def estimate_lag(imu, tablet, rate=1000.0, max_lag=0.5, margin=0.3):
+    """
+    Input:
+        imu: IMU rows (e.g. from `loader.load`), with corrected `timestamp`
+        tablet: tablet rows (e.g. from `loader.load`)
+        rate: common grid rate, in Hz
+        max_lag: maximal lag, in seconds
+        margin: duration around each tap used for correlation, in seconds
+
+    Output:
+        offset: lag of IMU with respect to tablet, in nanoseconds (i.e. IMU time is tablet time plus offset)
+        score: normalized correlation at the peak, in [-1, 1] (NaN if there is no tap)
+    """
+    origin = int(tablet["host_timestamp"][0])
+    t_tablet = (tablet["host_timestamp"] - origin) * 1e-9
+    t_imu = (imu["timestamp"] - origin) * 1e-9
+
+    # Common grid, over the overlap
+    start = max(t_tablet[0], t_imu[0])
+    stop = min(t_tablet[-1], t_imu[-1])
+    if stop - start <= 2.0 * max_lag:
+        return 0, float("nan")
+    grid = np.arange(start, stop, 1.0 / rate)
+    mask = tap_regions(t_tablet, tablet["pressure"], grid, margin)
+    if not mask.any():
+        return 0, float("nan")
+
+    # Onsets: pressure increase on the tablet, acceleration norm change on the IMU
+    pressure = np.interp(grid, t_tablet, tablet["pressure"])
+    tablet_signal = np.maximum(np.gradient(pressure), 0.0)
+    norm = np.sqrt(imu["ax"].astype(np.float64) ** 2 + imu["ay"] ** 2 + imu["az"] ** 2)
+    imu_signal = np.abs(np.gradient(np.interp(grid, t_imu, norm)))
+
+    # IMU signal is not masked, so that taps can move in and out of regions while shifting
+    a = _normalize(imu_signal, np.ones(grid.shape[0], dtype=bool))
+    b = _normalize(tablet_signal, mask)
+    lags, values = cross_correlation(a, b, int(max_lag * rate))
+    i = int(np.argmax(values))
+    lag = lags[0] + refine(values, i)
+
+    # Peak only sums over tablet regions, so IMU signal is normalized over the same samples, shifted by the lag
+    shifted = np.flatnonzero(mask) + lags[i]
+    shifted = shifted[(shifted >= 0) & (shifted < a.shape[0])]
+    score = values[i] / (np.sqrt((a[shifted] ** 2).sum() * (b[mask] ** 2).sum()) + 1e-12)
+    return int(round(lag / rate * 1e9)), float(score)
+
+
+def synchronize_catalog(catalog, min_score=DEFAULT_MIN_SCORE, **kwargs):
+    """
+    Estimate lag of every paired session, and store it in the catalog as `offset` (in nanoseconds).
+
+    Input:
+        min_score: weaker matches are not used as `offset` (and a previous one is removed), only `lag_score` is kept
+
+    Output:
+        dictionary from session name to `(offset, score)`
+    """
+    results = {}
+    for name, session in catalog.sessions.items():
+        if session["imu"] is None:
+            continue
+        imu = loader.load(f"{catalog.directory}/{session['imu']}", calibrate=False)
+        tablet = loader.load(f"{catalog.directory}/{session['tablet']}")
+        offset, score = estimate_lag(imu, tablet, **kwargs)
+        if np.isfinite(score):
+            session["lag_score"] = score
+            if score >= min_score:
+                session["offset"] = offset
+            else:
+                session.pop("offset", None)
+        results[name] = offset, score
+    catalog.save()
+    return results
+
+
+if __name__ == "__main__":
+
+    # Estimate lag of all sessions of a data directory
+    import catalog
+
+    parser = argparse.ArgumentParser(description="Estimate IMU/tablet lag from pen taps, and store it in the catalog")
+    parser.add_argument("directory", nargs="?", default=catalog.DEFAULT_DIRECTORY)
+    parser.add_argument("--max-lag", type=float, default=0.5, help="in seconds")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE, help="minimal score to store the lag")
+    args = parser.parse_args()
+
+    sessions = catalog.Catalog(args.directory).scan()
+    for name, (offset, score) in synchronize_catalog(sessions, args.min_score, max_lag=args.max_lag).items():
+        status = "" if score >= args.min_score else ", not applied"
+        print(f"{name}: {offset * 1e-6:+.2f} ms (score {score:.2f}{status})")
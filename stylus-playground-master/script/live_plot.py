@@ -0,0 +1,215 @@
+import argparse
+import threading
+
+import numpy as np
+
+import matplotlib.pyplot as plt
+
+import serial
+from serial.tools.list_ports import comports
+
+import calibration
+from framer import Framer
+from ring import History, RingBuffer
+
+
+# Plot is redrawn at a fixed rate, whatever the sensor rate:
+#  - each port is read and parsed in its own thread, and samples are handed over through a ring buffer
+#  - the render loop keeps the last few seconds in a preallocated history, and decimates it to the screen width
+#  - axes and labels are only drawn when limits change, otherwise lines are blitted over a cached background
+
+
+class Reader:
+    """
+    Serial port reader, running in a background thread.
+    """
+
+    def __init__(self, port, baud_rate=9600, capacity=1 << 14):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.abort = False
+        self.thread = None
+        self.framer = Framer(8)
+        self.calibration = calibration.load()
+
+        # Arduino timestamp, acceleration, angular velocity
+        self.ring = RingBuffer(capacity, 7)
+
+    def open(self):
+        assert self.thread is None
+        self.abort = False
+        self.thread = threading.Thread(target=self.run, name=f"Reader {self.port}", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.abort = True
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        with serial.Serial(self.port, self.baud_rate, timeout=0.1) as port:
+            while not self.abort:
+
+                # Read directly into the framer, or wait for at least one byte
+                if self.framer.read(port) == 0:
+                    self.framer.feed(port.read(1))
+
+                # Parse all complete lines at once, and correct both sensors in place
+                records = self.framer.parse(self.framer.pop())
+                self.calibration.apply(records[:, 1:7], out=records[:, 1:7])
+                self.ring.extend(records[:, :7])
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.close()
+
+
+def decimate(t, values, t0, t1, width):
+    """
+    Input:
+        t: (N,) array, sorted timestamps
+        values: (N, C) array
+        t0: left edge of the plot
+        t1: right edge of the plot
+        width: number of bins, typically the width of the axes in pixels
+
+    Output:
+        t: (M,) array
+        values: (M, C) array, minimum and maximum of every non-empty bin (so M <= 2 * width)
+    """
+    lo, hi = np.searchsorted(t, [t0, t1], side="right")
+    lo = max(lo - 1, 0)
+    t = t[lo:hi]
+    values = values[lo:hi]
+    if t.shape[0] <= 2 * width:
+        return t, values
+
+    # Bins are given by their first sample, empty bins are skipped
+    bins = ((t - t0) * (width / (t1 - t0))).astype(np.int64)
+    starts = np.flatnonzero(np.diff(bins, prepend=-1))
+
+    # Extremes of each bin, drawn as a vertical segment at the bin start
+    minimum = np.minimum.reduceat(values, starts, axis=0)
+    maximum = np.maximum.reduceat(values, starts, axis=0)
+    result = np.empty((2 * starts.shape[0], values.shape[1]))
+    result[0::2] = minimum
+    result[1::2] = maximum
+    return np.repeat(t[starts], 2), result
+
+
+class Plot:
+    """
+    Acceleration and angular velocity of one or more IMUs, one column per IMU.
+    """
+
+    def __init__(self, names, window=5.0, capacity=1 << 14):
+        self.window = window
+        self.histories = [History(capacity, 7) for _ in names]
+
+        # Time axis is relative to the last sample, so that it never changes
+        self.fig, axes = plt.subplots(2, len(names), sharex=True, squeeze=False, figsize=(6 * len(names), 4))
+        self.lines = []
+        for column, name in enumerate(names):
+            lines = []
+            for row, (label, unit) in enumerate([("acceleration", "g"), ("angular velocity", "rad/s")]):
+                ax = axes[row, column]
+                for color in "rgb":
+                    line, = ax.plot([], [], c=color, alpha=0.5, animated=True)
+                    lines.append(line)
+                ax.set_xlim(-window, 0.0)
+                ax.set_ylim(-1.0, 1.0)
+                ax.set_ylabel(f"{label} [{unit}]")
+            axes[0, column].set_title(name)
+            axes[1, column].set_xlabel("time [s]")
+            self.lines.append(lines)
+        self.axes = axes
+        self.fig.tight_layout()
+
+        # Cache background whenever the figure is fully drawn (e.g. on resize)
+        self.background = None
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def extend(self, index, rows):
+        self.histories[index].extend(rows)
+
+    def update_limits(self):
+        """
+        Grow symmetric limits to fit visible data, return whether anything changed.
+        """
+        changed = False
+        for column, history in enumerate(self.histories):
+            data = history.last()
+            if data.shape[0] == 0:
+                continue
+            t = data[:, 0] * 1e-3
+            visible = data[np.searchsorted(t, t[-1] - self.window):]
+            for row, values in enumerate([visible[:, 1:4], visible[:, 4:7]]):
+                ax = self.axes[row, column]
+                limit = ax.get_ylim()[1]
+                peak = np.abs(values).max()
+                if peak > limit:
+                    ax.set_ylim(-1.5 * peak, 1.5 * peak)
+                    changed = True
+        return changed
+
+    def draw_lines(self):
+        for column, history in enumerate(self.histories):
+            data = history.last()
+            if data.shape[0] == 0:
+                continue
+            t = data[:, 0] * 1e-3
+            t = t - t[-1]
+            width = int(self.axes[0, column].bbox.width)
+            t, values = decimate(t, data[:, 1:7], -self.window, 0.0, width)
+            for i, line in enumerate(self.lines[column]):
+                line.set_data(t, values[:, i])
+                line.axes.draw_artist(line)
+
+    def redraw(self):
+
+        # Full redraw if axes changed, which also caches a new background
+        canvas = self.fig.canvas
+        if self.background is None or self.update_limits():
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self.draw_lines()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+
+if __name__ == "__main__":
+
+    # Ports can be given as arguments (e.g. pseudo-terminals from `replay.py`), otherwise take the first one
+    parser = argparse.ArgumentParser(description="Plot live IMU signals")
+    parser.add_argument("ports", nargs="*")
+    parser.add_argument("--window", type=float, default=5.0, help="in seconds")
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+    ports = args.ports or [comports()[0].device]
+
+    readers = [Reader(port) for port in ports]
+    plt.ion()
+    plot = Plot(ports, window=args.window)
+    plt.show(block=False)
+    for reader in readers:
+        reader.open()
+    try:
+        while plt.fignum_exists(plot.fig.number):
+
+            # Take everything received since last frame, from all ports
+            for i, reader in enumerate(readers):
+                plot.extend(i, reader.ring.drain())
+
+            plot.redraw()
+            plot.fig.canvas.start_event_loop(1.0 / args.fps)
+    finally:
+        for reader in readers:
+            reader.close()
@@ -0,0 +1,208 @@
+import os
+import warnings
+
+import numpy as np
+
+import calibration
+import clock
+import recording
+from recording import IMU_DTYPE, TABLET_DTYPE
+
+
+# Column names, when the file has no header
+# Note: `timestamp` is not part of CSV dumps, it is computed on load (see `clock.synchronize`)
+IMU_COLUMNS = IMU_DTYPE.names[:-1]
+TABLET_COLUMNS = TABLET_DTYPE.names
+
+# Parsed files are cached next to them, keyed by size and modification time
+CACHE_DIRECTORY = ".cache"
+
+
+def sniff_encoding(raw):
+    """
+    Input:
+        raw: first bytes of a text file
+
+    Output:
+        name of the encoding, for `bytes.decode`
+    """
+
+    # Byte order mark, as written by PowerShell redirection
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
+    if raw.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+
+    # ASCII content in UTF-16, without mark, has a zero byte every two bytes
+    head = raw[:1024]
+    if head.count(b"\x00") > len(head) // 4:
+        return "utf-16-le" if head[1::2].count(b"\x00") > head[::2].count(b"\x00") else "utf-16-be"
+    return "utf-8"
+
+
+def read_lines(path):
+    with open(path, "rb") as file:
+        raw = file.read()
+    return raw.decode(sniff_encoding(raw), errors="replace").splitlines()
+
+
+def detect_schema(lines):
+    """
+    Input:
+        lines: lines of a CSV dump
+
+    Output:
+        kind: either `imu` or `tablet`
+        columns: column names
+        start: index of the first data line
+    """
+    columns = None
+    start = 0
+    for start, line in enumerate(lines):
+        line = line.strip()
+
+        # Skip preamble (e.g. list of tablet controls, dumped by older capture scripts) and blank lines
+        if not line or line.startswith("["):
+            continue
+
+        # Header, or first data line
+        if not line[0].isdigit() and line[0] != "-":
+            columns = tuple(name.strip() for name in line.split(","))
+            start += 1
+        break
+
+    # Without header, guess from the number of fields
+    if columns is None:
+        count = len(lines[start].split(",")) if start < len(lines) else 0
+        if count == len(IMU_COLUMNS):
+            columns = IMU_COLUMNS
+        elif count == len(TABLET_COLUMNS):
+            columns = TABLET_COLUMNS
+        else:
+            raise ValueError(f"Unknown schema, with {count} fields")
+
+    if "arduino_timestamp" in columns:
+        return "imu", columns, start
+    if "pressure" in columns:
+        return "tablet", columns, start
+    raise ValueError(f"Unknown schema, with columns {columns}")
+
+
+def parse(lines, count):
+    """
+    Input:
+        lines: data lines, without header
+        count: number of fields per line
+
+    Output:
+        (N, count) float64 array, malformed lines (e.g. truncated last line) are skipped
+    """
+
+    # Fast path, everything at once
+    text = ",".join(lines)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            values = np.fromstring(text, sep=",") if text else np.zeros(0)
+        if values.shape[0] == len(lines) * count:
+            return values.reshape(-1, count)
+    except ValueError:
+        pass
+
+    # Slow path, line by line
+    rows = []
+    for line in lines:
+        fields = line.strip().split(",")
+        if len(fields) != count:
+            continue
+        try:
+            rows.append([float(field) for field in fields])
+        except ValueError:
+            continue
+    return np.array(rows, dtype=np.float64).reshape(-1, count)
+
+
+def read_csv(path):
+    """
+    Input:
+        path: CSV dump, as written by `collect_imu.py` or `collect_tablet.py` (any encoding, with or without header)
+
+    Output:
+        kind: either `imu` or `tablet`
+        data: structured array with `IMU_DTYPE` or `TABLET_DTYPE`
+    """
+    lines = read_lines(path)
+    kind, columns, start = detect_schema(lines)
+    lines = [line for line in lines[start:] if line.strip()]
+    values = parse(lines, len(columns))
+
+    # Typed columns, missing ones are left to zero
+    dtype = IMU_DTYPE if kind == "imu" else TABLET_DTYPE
+    data = np.zeros(values.shape[0], dtype=dtype)
+    for i, name in enumerate(columns):
+        if name in dtype.names:
+            data[name] = values[:, i]
+
+    # Older dumps do not have corrected timestamps
+    if kind == "imu" and "timestamp" not in columns:
+        data["timestamp"] = clock.synchronize(data["arduino_timestamp"], data["host_timestamp"])
+    return kind, data
+
+
+def cache_path(path):
+    stat = os.stat(path)
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIRECTORY, f"{name}.{stat.st_size}.{stat.st_mtime_ns}.npy")
+
+
+def load(path, calibrate=True, cache=True):
+    """
+    Input:
+        path: CSV dump, or binary recording (see `recording.py`)
+        calibrate: apply IMU calibration (see `calibration.py`), or calibration object to use
+        cache: store parsed data in a binary sidecar, loaded as a memory map next time
+
+    Output:
+        structured array with `IMU_DTYPE` or `TABLET_DTYPE` (read-only memory map if nothing to correct)
+    """
+
+    # Binary recordings are already typed
+    if recording.is_recording(path):
+        data = recording.load(path)
+    else:
+        data = None
+        target = cache_path(path) if cache else None
+        if target is not None and os.path.exists(target):
+            try:
+                data = np.load(target, mmap_mode="r")
+            except (OSError, ValueError):
+                data = None
+        if data is None:
+            _, data = read_csv(path)
+            if target is not None:
+                _save(target, data)
+
+    # Correct raw sensor values, once for all columns
+    if calibrate is not False and data.dtype.names == IMU_DTYPE.names:
+        if calibrate is True:
+            calibrate = calibration.load()
+        data = np.array(data)
+        calibrate.apply_columns(data)
+    return data
+
+
+def _save(target, data):
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+
+    # Remove stale versions of the same file
+    prefix = os.path.basename(target).rsplit(".", 3)[0] + "."
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(".npy"):
+            os.remove(os.path.join(directory, name))
+
+    # Write to a temporary file first, so that a concurrent reader never sees a partial file
+    temporary = f"{target}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.save(file, data)
+    os.replace(temporary, target)
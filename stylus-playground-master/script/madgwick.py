@@ -0,0 +1,235 @@
+import math
+
+import numpy as np
+
+# Numba is optional, but the per-sample loop is much faster when compiled
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Same default as `ahrs.filters.Madgwick`, for IMU (i.e. without magnetometer)
+DEFAULT_GAIN = 0.033
+
+# Without Numba, smaller batches are filtered one segment at a time, on Python floats
+SCALAR_BATCH_SIZE = 32
+
+
+def acc2q(acc):
+    """
+    Vectorized equivalent of `ahrs.common.orientation.acc2q`.
+
+    Input:
+        acc: (..., 3) array, accelerometer samples (any unit)
+
+    Output:
+        (..., 4) array, quaternions (w, x, y, z) aligning gravity, without any rotation around the vertical axis
+    """
+    acc = np.asarray(acc, dtype=np.float64)
+    norm = np.linalg.norm(acc, axis=-1, keepdims=True)
+    a = acc / np.where(norm > 0.0, norm, 1.0)
+    ax, ay, az = a[..., 0], a[..., 1], a[..., 2]
+
+    # Euler angles from gravity vector, then to quaternion
+    ex = np.arctan2(ay, az)
+    ey = np.arctan2(-ax, np.sqrt(ay ** 2 + az ** 2))
+    cx2 = np.cos(ex / 2.0)
+    sx2 = np.sin(ex / 2.0)
+    cy2 = np.cos(ey / 2.0)
+    sy2 = np.sin(ey / 2.0)
+    q = np.stack([cx2 * cy2, sx2 * cy2, cx2 * sy2, -sx2 * sy2], axis=-1)
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+
+    # Without measurement, assume identity
+    q[norm[..., 0] == 0.0] = [1.0, 0.0, 0.0, 0.0]
+    return q
+
+
+def _filter_python(q0, gyr, acc, dt, gain, out):
+
+    # Same steps as `ahrs.filters.Madgwick.updateIMU`, one scalar at a time
+    for b in range(gyr.shape[0]):
+        qw, qx, qy, qz = q0[b, 0], q0[b, 1], q0[b, 2], q0[b, 3]
+        norm = np.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+        qw, qx, qy, qz = qw / norm, qx / norm, qy / norm, qz / norm
+        out[b, 0, 0], out[b, 0, 1], out[b, 0, 2], out[b, 0, 3] = qw, qx, qy, qz
+        for i in range(1, gyr.shape[1]):
+            gx, gy, gz = gyr[b, i, 0], gyr[b, i, 1], gyr[b, i, 2]
+
+            # Without rotation, orientation is left as is
+            if gx == 0.0 and gy == 0.0 and gz == 0.0:
+                out[b, i, 0], out[b, i, 1], out[b, i, 2], out[b, i, 3] = qw, qx, qy, qz
+                continue
+
+            # Integrate angular rate, i.e. `0.5 * q * (0, g)`
+            dw = 0.5 * (-qx * gx - qy * gy - qz * gz)
+            dx = 0.5 * (qw * gx + qy * gz - qz * gy)
+            dy = 0.5 * (qw * gy - qx * gz + qz * gx)
+            dz = 0.5 * (qw * gz + qx * gy - qy * gx)
+
+            # Correct using gravity direction, if measured
+            ax, ay, az = acc[b, i, 0], acc[b, i, 1], acc[b, i, 2]
+            a_norm = np.sqrt(ax * ax + ay * ay + az * az)
+            if a_norm > 0.0:
+                ax, ay, az = ax / a_norm, ay / a_norm, az / a_norm
+                f0 = 2.0 * (qx * qz - qw * qy) - ax
+                f1 = 2.0 * (qw * qx + qy * qz) - ay
+                f2 = 2.0 * (0.5 - qx * qx - qy * qy) - az
+
+                # Gradient is `J.T @ f`
+                sw = -2.0 * qy * f0 + 2.0 * qx * f1
+                sx = 2.0 * qz * f0 + 2.0 * qw * f1 - 4.0 * qx * f2
+                sy = -2.0 * qw * f0 + 2.0 * qz * f1 - 4.0 * qy * f2
+                sz = 2.0 * qx * f0 + 2.0 * qy * f1
+                s_norm = np.sqrt(sw * sw + sx * sx + sy * sy + sz * sz)
+                if s_norm > 0.0:
+                    dw -= gain * sw / s_norm
+                    dx -= gain * sx / s_norm
+                    dy -= gain * sy / s_norm
+                    dz -= gain * sz / s_norm
+
+            # Step, and project back on unit sphere
+            qw, qx, qy, qz = qw + dw * dt[b, i], qx + dx * dt[b, i], qy + dy * dt[b, i], qz + dz * dt[b, i]
+            norm = np.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+            qw, qx, qy, qz = qw / norm, qx / norm, qy / norm, qz / norm
+            out[b, i, 0], out[b, i, 1], out[b, i, 2], out[b, i, 3] = qw, qx, qy, qz
+
+
+def _filter_floats(q0, gyr, acc, dt, gain):
+
+    # Same steps as `_filter_python`, on Python floats and lists, which is much faster than NumPy scalars
+    qw, qx, qy, qz = q0
+    norm = math.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+    qw, qx, qy, qz = qw / norm, qx / norm, qy / norm, qz / norm
+    out = [(qw, qx, qy, qz)]
+    for (gx, gy, gz), (ax, ay, az), step in zip(gyr[1:], acc[1:], dt[1:]):
+
+        # Without rotation, orientation is left as is
+        if gx == 0.0 and gy == 0.0 and gz == 0.0:
+            out.append((qw, qx, qy, qz))
+            continue
+
+        # Integrate angular rate, i.e. `0.5 * q * (0, g)`
+        dw = 0.5 * (-qx * gx - qy * gy - qz * gz)
+        dx = 0.5 * (qw * gx + qy * gz - qz * gy)
+        dy = 0.5 * (qw * gy - qx * gz + qz * gx)
+        dz = 0.5 * (qw * gz + qx * gy - qy * gx)
+
+        # Correct using gravity direction, if measured
+        a_norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if a_norm > 0.0:
+            ax, ay, az = ax / a_norm, ay / a_norm, az / a_norm
+            f0 = 2.0 * (qx * qz - qw * qy) - ax
+            f1 = 2.0 * (qw * qx + qy * qz) - ay
+            f2 = 2.0 * (0.5 - qx * qx - qy * qy) - az
+
+            # Gradient is `J.T @ f`
+            sw = -2.0 * qy * f0 + 2.0 * qx * f1
+            sx = 2.0 * qz * f0 + 2.0 * qw * f1 - 4.0 * qx * f2
+            sy = -2.0 * qw * f0 + 2.0 * qz * f1 - 4.0 * qy * f2
+            sz = 2.0 * qx * f0 + 2.0 * qy * f1
+            s_norm = math.sqrt(sw * sw + sx * sx + sy * sy + sz * sz)
+            if s_norm > 0.0:
+                dw -= gain * sw / s_norm
+                dx -= gain * sx / s_norm
+                dy -= gain * sy / s_norm
+                dz -= gain * sz / s_norm
+
+        # Step, and project back on unit sphere
+        qw, qx, qy, qz = qw + dw * step, qx + dx * step, qy + dy * step, qz + dz * step
+        norm = math.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+        qw, qx, qy, qz = qw / norm, qx / norm, qy / norm, qz / norm
+        out.append((qw, qx, qy, qz))
+    return out
+
+
+def _filter_numpy(q0, gyr, acc, dt, gain, out):
+
+    # Same steps as `_filter_python`, but vectorized over the batch axis (i.e. only the time loop remains)
+    q = q0 / np.linalg.norm(q0, axis=-1, keepdims=True)
+    out[:, 0] = q
+    a_norm = np.linalg.norm(acc, axis=-1)
+    a = acc / np.where(a_norm > 0.0, a_norm, 1.0)[..., None]
+    is_rotating = (gyr != 0.0).any(axis=-1)
+    has_gravity = a_norm > 0.0
+    for i in range(1, gyr.shape[1]):
+        qw, qx, qy, qz = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+        gx, gy, gz = gyr[:, i, 0], gyr[:, i, 1], gyr[:, i, 2]
+        ax, ay, az = a[:, i, 0], a[:, i, 1], a[:, i, 2]
+
+        # Integrate angular rate, i.e. `0.5 * q * (0, g)`
+        q_dot = 0.5 * np.stack([
+            -qx * gx - qy * gy - qz * gz,
+            qw * gx + qy * gz - qz * gy,
+            qw * gy - qx * gz + qz * gx,
+            qw * gz + qx * gy - qy * gx,
+        ], axis=-1)
+
+        # Correct using gravity direction, if measured
+        f0 = 2.0 * (qx * qz - qw * qy) - ax
+        f1 = 2.0 * (qw * qx + qy * qz) - ay
+        f2 = 2.0 * (0.5 - qx * qx - qy * qy) - az
+        s = np.stack([
+            -2.0 * qy * f0 + 2.0 * qx * f1,
+            2.0 * qz * f0 + 2.0 * qw * f1 - 4.0 * qx * f2,
+            -2.0 * qw * f0 + 2.0 * qz * f1 - 4.0 * qy * f2,
+            2.0 * qx * f0 + 2.0 * qy * f1,
+        ], axis=-1)
+        s_norm = np.linalg.norm(s, axis=-1)
+        is_corrected = has_gravity[:, i] & (s_norm > 0.0)
+        q_dot -= np.where(is_corrected, gain / np.where(s_norm > 0.0, s_norm, 1.0), 0.0)[:, None] * s
+
+        # Step, and project back on unit sphere
+        q_new = q + q_dot * dt[:, i, None]
+        q_new /= np.linalg.norm(q_new, axis=-1, keepdims=True)
+
+        # Without rotation, orientation is left as is
+        q = np.where(is_rotating[:, i, None], q_new, q)
+        out[:, i] = q
+
+
+if numba is not None:
+    _filter_numba = numba.njit(cache=True, nogil=True)(_filter_python)
+
+
+def estimate(gyr, acc, dt, q0=None, gain=DEFAULT_GAIN):
+    """
+    Batch equivalent of calling `ahrs.filters.Madgwick.updateIMU` for each sample, i.e.
+    `Q[0] = q0` and `Q[i] = updateIMU(Q[i - 1], gyr[i], acc[i], dt[i])`.
+
+    Input:
+        gyr: (N, 3) or (B, N, 3) array, angular velocity, in rad/s
+        acc: (N, 3) or (B, N, 3) array, acceleration (any unit)
+        dt: scalar, (N,) or (B, N) array, time since previous sample, in seconds (first one is ignored)
+        q0: (4,) or (B, 4) array, initial orientation, defaults to `acc2q` of the first accelerometer sample
+        gain: filter gain, see `ahrs.filters.Madgwick`
+
+    Output:
+        (N, 4) or (B, N, 4) array, quaternions (w, x, y, z)
+
+    Note: segments of different lengths can be batched by padding them (e.g. repeating last sample)
+    """
+    gyr = np.asarray(gyr, dtype=np.float64)
+    acc = np.asarray(acc, dtype=np.float64)
+    is_batched = gyr.ndim == 3
+    if not is_batched:
+        gyr = gyr[None]
+        acc = acc[None]
+    batch_size, n, _ = gyr.shape
+    dt = np.ascontiguousarray(np.broadcast_to(np.asarray(dt, dtype=np.float64), (batch_size, n)))
+    if q0 is None:
+        q0 = acc2q(acc[:, 0]) if n > 0 else np.tile([1.0, 0.0, 0.0, 0.0], (batch_size, 1))
+    q0 = np.ascontiguousarray(np.broadcast_to(np.asarray(q0, dtype=np.float64), (batch_size, 4)))
+
+    # Use compiled loop if possible, otherwise loop on floats for a few segments, or vectorize over a larger batch
+    out = np.empty((batch_size, n, 4))
+    if n > 0:
+        if numba is not None:
+            _filter_numba(q0, np.ascontiguousarray(gyr), np.ascontiguousarray(acc), dt, gain, out)
+        elif batch_size < SCALAR_BATCH_SIZE:
+            for b in range(batch_size):
+                out[b] = _filter_floats(q0[b].tolist(), gyr[b].tolist(), acc[b].tolist(), dt[b].tolist(), gain)
+        else:
+            _filter_numpy(q0, gyr, acc, dt, gain, out)
+    return out if is_batched else out[0]
@@ -0,0 +1,233 @@
+import numpy as np
+
+import clock
+from recording import IMU_DTYPE, TABLET_DTYPE
+
+
+# IMU rows, augmented with tablet state at the same host timestamp
+MERGED_DTYPE = np.dtype(IMU_DTYPE.descr + [descr for descr in TABLET_DTYPE.descr if descr[0] != "host_timestamp"])
+
+# Channels that must not be blended, the closest sample is used instead
+NEAREST_COLUMNS = ("touch",)
+
+# Events reported once, on the first IMU row at or after them
+EVENT_COLUMNS = ("reset",)
+
+
+def _names(columns):
+    if isinstance(columns, np.ndarray):
+        return columns.dtype.names or ()
+    return columns.keys()
+
+
+def _to_rows(columns, dtype):
+
+    # Structured arrays are used as-is, other mappings are copied (scalars are broadcast, missing columns are zero)
+    if isinstance(columns, np.ndarray) and columns.dtype == dtype:
+        return columns
+    names = [name for name in dtype.names if name in _names(columns)]
+    size = max((len(columns[name]) for name in names if np.ndim(columns[name]) > 0), default=0)
+    rows = np.zeros(size, dtype=dtype)
+    for name in names:
+        rows[name] = columns[name]
+    return rows
+
+
+class _Rows:
+    """
+    Preallocated rows, appended at the end and consumed from the front, in amortized O(1) per row.
+    """
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.start = 0
+        self.stop = 0
+
+    def view(self):
+        return self.data[self.start:self.stop]
+
+    def extend(self, rows):
+        size = self.stop - self.start
+        count = rows.shape[0]
+        if self.stop + count > self.data.shape[0]:
+
+            # Move live rows to the front, and grow so that at least half of the buffer is free afterwards
+            capacity = self.data.shape[0]
+            while 2 * (size + count) > capacity:
+                capacity *= 2
+            data = self.data if capacity == self.data.shape[0] else np.zeros(capacity, dtype=self.data.dtype)
+            data[:size] = self.data[self.start:self.stop]
+            self.data = data
+            self.start = 0
+            self.stop = size
+        self.data[self.stop:self.stop + count] = rows
+        self.stop += count
+
+    def consume(self, count):
+        self.start += count
+        if self.start == self.stop:
+            self.start = self.stop = 0
+
+
+class Merger:
+    """
+    Incremental as-of join of IMU and tablet streams, on corrected IMU timestamps and tablet host timestamps.
+
+    IMU rows are emitted once the tablet stream went past them, so that tablet state can be interpolated. Tablet rows
+    are only sent on change, so rows that waited for more than `horizon` are emitted with the last tablet state (or NaN
+    if there is none yet). Only these pending IMU rows and a single tablet row of look-behind are kept, so memory does
+    not depend on recording duration, even if one stream is missing.
+    """
+
+    def __init__(self, imu_key="timestamp", tablet_key="host_timestamp", horizon=1_000_000_000):
+        """
+        Input:
+            imu_key: IMU column to join on, defaults to the corrected clock (see `clock.py`)
+            tablet_key: tablet column to join on, in the same time base
+            horizon: maximal wait for the tablet stream, in nanoseconds (None to wait forever)
+        """
+        self.imu_key = imu_key
+        self.tablet_key = tablet_key
+        self.horizon = horizon
+        self.imu = _Rows(IMU_DTYPE)
+        self.tablet = _Rows(TABLET_DTYPE)
+        self.events = {name: np.zeros(0, dtype=np.int64) for name in EVENT_COLUMNS}
+        self.latest = None
+        self.count = 0
+
+    def push_imu(self, columns):
+        """
+        Input:
+            columns: IMU rows, as a mapping from column name to values (e.g. structured array)
+
+        Output:
+            structured array with `MERGED_DTYPE`, rows that can be merged so far
+        """
+        rows = _to_rows(columns, IMU_DTYPE)
+
+        # Without corrected timestamps, host timestamps are used as-is
+        if "timestamp" not in _names(columns):
+            rows["timestamp"] = rows["host_timestamp"]
+        self.imu.extend(rows)
+        self.update_latest(rows[self.imu_key])
+        return self.merge()
+
+    def push_tablet(self, columns):
+        """
+        Input:
+            columns: tablet rows, as a mapping from column name to values (e.g. structured array)
+
+        Output:
+            structured array with `MERGED_DTYPE`, rows that can be merged so far
+        """
+        rows = _to_rows(columns, TABLET_DTYPE)
+        for name in EVENT_COLUMNS:
+            timestamps = rows[self.tablet_key][rows[name] != 0]
+            if timestamps.shape[0] > 0:
+                self.events[name] = np.concatenate([self.events[name], timestamps])
+        self.tablet.extend(rows)
+        self.update_latest(rows[self.tablet_key])
+        return self.merge()
+
+    def update_latest(self, timestamps):
+        if timestamps.shape[0] > 0:
+            latest = int(timestamps[-1])
+            self.latest = latest if self.latest is None else max(self.latest, latest)
+
+    def merge(self):
+        results = []
+        last = None
+
+        # IMU rows before the first tablet row are outside of the overlap, and later ones must wait for the tablet
+        imu = self.imu.view()
+        tablet = self.tablet.view()
+        if tablet.shape[0] > 0 and imu.shape[0] > 0:
+            tablet_time = tablet[self.tablet_key]
+            imu_time = imu[self.imu_key]
+            start = np.searchsorted(imu_time, tablet_time[0], side="left")
+            end = np.searchsorted(imu_time, tablet_time[-1], side="right")
+            if end > start:
+                results.append(self.join(imu[start:end], tablet))
+                last = imu_time[end - 1]
+            self.imu.consume(end)
+
+        # Rows that waited too long keep the last tablet state
+        imu = self.imu.view()
+        limit = self.latest - self.horizon if self.horizon is not None and self.latest is not None else None
+        if limit is not None and imu.shape[0] > 0:
+            stale = np.searchsorted(imu[self.imu_key], limit, side="left")
+            if stale > 0:
+                results.append(self.join(imu[:stale], tablet[-1:]))
+                last = imu[self.imu_key][stale - 1]
+                self.imu.consume(stale)
+
+        # Keep one tablet row before next IMU row, for interpolation
+        cutoffs = [value for value in (last, limit) if value is not None]
+        if cutoffs and tablet.shape[0] > 0:
+            keep = max(np.searchsorted(tablet[self.tablet_key], max(cutoffs), side="right") - 1, 0)
+            self.tablet.consume(keep)
+
+        if not results:
+            return np.zeros(0, dtype=MERGED_DTYPE)
+        result = results[0] if len(results) == 1 else np.concatenate(results)
+        self.count += result.shape[0]
+        return result
+
+    def join(self, rows, tablet):
+        """
+        Input:
+            rows: IMU rows, sorted
+            tablet: tablet rows, surrounding IMU rows (if empty, tablet state is NaN)
+
+        Output:
+            structured array with `MERGED_DTYPE`
+        """
+        time = rows[self.imu_key]
+        result = np.zeros(rows.shape[0], dtype=MERGED_DTYPE)
+        for name in IMU_DTYPE.names:
+            result[name] = rows[name]
+        if tablet.shape[0] == 0:
+            for name in TABLET_DTYPE.names[1:]:
+                if name not in EVENT_COLUMNS:
+                    result[name] = np.nan
+            return result
+        tablet_time = tablet[self.tablet_key]
+
+        # Continuous channels are interpolated
+        for name in TABLET_DTYPE.names[1:]:
+            if name not in NEAREST_COLUMNS and name not in EVENT_COLUMNS:
+                result[name] = np.interp(time, tablet_time, tablet[name])
+
+        # Others use the closest tablet row
+        right = np.minimum(np.searchsorted(tablet_time, time, side="left"), tablet_time.shape[0] - 1)
+        left = np.maximum(right - 1, 0)
+        nearest = np.where(time - tablet_time[left] <= tablet_time[right] - time, left, right)
+        for name in NEAREST_COLUMNS:
+            result[name] = tablet[name][nearest]
+
+        # Events are assigned to the first row at or after them, unless it was not received yet
+        for name in EVENT_COLUMNS:
+            indices = np.searchsorted(time, self.events[name], side="left")
+            is_assigned = indices < time.shape[0]
+            result[name][indices[is_assigned]] = 1
+            self.events[name] = self.events[name][~is_assigned]
+        return result
+
+
+def merge(imu, tablet):
+    """
+    Input:
+        imu: IMU rows, as a mapping from column name to values (e.g. structured array or DataFrame)
+        tablet: tablet rows, as a mapping from column name to values
+
+    Output:
+        structured array with `MERGED_DTYPE`, IMU rows within the overlap of both streams
+    """
+
+    # Older dumps do not have corrected timestamps
+    if "timestamp" not in _names(imu):
+        imu = _to_rows(imu, IMU_DTYPE)
+        imu["timestamp"] = clock.synchronize(imu["arduino_timestamp"], imu["host_timestamp"])
+    merger = Merger(horizon=None)
+    merger.push_tablet(tablet)
+    return merger.push_imu(imu)
@@ -0,0 +1,170 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import frames
+import integration
+import madgwick
+from resample import resample_segment
+
+
+# Per-segment stages, in execution order, and the columns they produce
+STAGES = ("orientation", "frame", "integration", "resample")
+OUTPUT_COLUMNS = {
+    "orientation": ("q0", "q1", "q2", "q3"),
+    "frame": ("nav_ax", "nav_ay", "nav_az"),
+    "integration": ("vx", "vy", "vz", "px", "py", "pz"),
+}
+
+
+class SharedColumns:
+    """
+    Float columns stored in a single shared memory block, so that worker processes can access them without copies.
+    """
+
+    def __init__(self, names, size, name=None):
+        self.names = list(names)
+        self.size = size
+        self.is_owner = name is None
+        nbytes = max(len(self.names) * size * 8, 1)
+        if self.is_owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray((len(self.names), size), dtype=np.float64, buffer=self.shm.buf)
+
+    @classmethod
+    def from_columns(cls, columns, names=None):
+        names = list(columns.keys() if names is None else names)
+        size = len(columns[names[0]]) if names else 0
+        table = cls(names, size)
+        for i, name in enumerate(names):
+            table.array[i] = columns[name]
+        return table
+
+    def describe(self):
+        return self.shm.name, self.names, self.size
+
+    @classmethod
+    def attach(cls, description):
+        name, names, size = description
+        return cls(names, size, name=name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __getitem__(self, name):
+        return self.array[self.names.index(name)]
+
+    def to_dict(self):
+        return {name: self.array[i].copy() for i, name in enumerate(self.names)}
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def segments(reset):
+    """
+    Input:
+        reset: (N,) array, reset flags (e.g. merged `reset` column)
+
+    Output:
+        (K, 2) array, start and stop index of each segment, i.e. rows between two consecutive resets
+    """
+    indices, = np.nonzero(np.asarray(reset) != 0)
+    return np.stack([indices[:-1], indices[1:]], axis=-1)
+
+
+# Tables attached by each worker, once
+_input = None
+_output = None
+
+
+def _attach(input_description, output_description):
+    global _input, _output
+    _input = SharedColumns.attach(input_description)
+    _output = SharedColumns.attach(output_description)
+
+
+def _process(start, stop, stages, options):
+    """
+    Run stages on a single segment, reading from and writing to the attached tables.
+    """
+    rows = slice(start, stop)
+    if stop - start < 2:
+        return None
+    t = _input["arduino_timestamp"][rows] * 1e-3
+    acc = np.stack([_input[name][rows] for name in ["ax", "ay", "az"]], axis=-1)
+    gyr = np.stack([_input[name][rows] for name in ["gx", "gy", "gz"]], axis=-1)
+
+    # Orientation and linear acceleration, in navigation frame
+    if "orientation" in stages:
+        q = madgwick.estimate(gyr, acc, np.diff(t, prepend=t[0]), gain=options["gain"])
+        for i, name in enumerate(OUTPUT_COLUMNS["orientation"]):
+            _output[name][rows] = q[:, i]
+    if "frame" in stages:
+        q = np.stack([_output[name][rows] for name in OUTPUT_COLUMNS["orientation"]], axis=-1)
+        nav = frames.linear_acceleration(q, acc, frames.GRAVITY * options["gravity"])
+        for i, name in enumerate(OUTPUT_COLUMNS["frame"]):
+            _output[name][rows] = nav[:, i]
+
+    # Velocity is zero when not moving, vertical velocity is zero on the tablet
+    if "integration" in stages:
+        nav = np.stack([_output[name][rows] for name in OUTPUT_COLUMNS["frame"]], axis=-1)
+        mask = integration.zero_velocity(integration.stationary(acc, gyr, gravity=options["gravity"]))
+        if "touch" in _input:
+            mask |= integration.contact(touch=_input["touch"][rows])
+        v, p = integration.integrate(t, nav, mask)
+        for i, name in enumerate(OUTPUT_COLUMNS["integration"]):
+            _output[name][rows] = (v if i < 3 else p)[:, i % 3]
+
+    # Resampled traces have variable length, they are sent back
+    if "resample" in stages:
+        columns = {name: _input[name][rows] for name in _input.names}
+        return resample_segment(columns, options["smoothness"], options["step"])
+    return None
+
+
+def process(columns, bounds, stages=STAGES, processes=None, gain=madgwick.DEFAULT_GAIN, gravity=1.0, smoothness=200.0, step=1.0):
+    """
+    Input:
+        columns: mapping from column name to values (e.g. merged DataFrame), with calibrated IMU data
+        bounds: (K, 2) array, start and stop index of each segment (see `segments`)
+        stages: subset of `STAGES`, later stages need earlier ones (except resampling)
+        processes: number of worker processes, defaults to the number of cores
+        gain: Madgwick filter gain
+        gravity: gravity norm, in the same unit as accelerations
+        smoothness: spline smoothing factor, for resampling
+        step: resampling step, for resampling
+
+    Output:
+        outputs: dictionary of (N,) arrays, NaN outside of segments (see `OUTPUT_COLUMNS`)
+        resampled: list of resampled segments (or None), if requested
+    """
+    stages = [stage for stage in STAGES if stage in stages]
+    names = [name for stage in stages for name in OUTPUT_COLUMNS.get(stage, ())]
+    required = ["arduino_timestamp", "ax", "ay", "az", "gx", "gy", "gz"]
+    optional = ["host_timestamp", "x", "y", "z", "in_range", "touch", "pressure"]
+    input_names = required + [name for name in optional if name in columns]
+    options = {"gain": gain, "gravity": gravity, "smoothness": smoothness, "step": step}
+    bounds = np.asarray(bounds, dtype=np.int64).reshape(-1, 2)
+
+    # Columns are copied once in shared memory, workers only receive segment bounds
+    with SharedColumns.from_columns(columns, input_names) as inputs, SharedColumns(names, inputs.size) as outputs:
+        outputs.array[:] = np.nan
+        processes = processes or os.cpu_count()
+        with ProcessPoolExecutor(processes, initializer=_attach, initargs=(inputs.describe(), outputs.describe())) as executor:
+            futures = [executor.submit(_process, int(start), int(stop), stages, options) for start, stop in bounds]
+            resampled = [future.result() for future in futures]
+        return outputs.to_dict(), resampled
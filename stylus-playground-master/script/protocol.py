@@ -0,0 +1,145 @@
+import numpy as np
+
+
+# Binary frame, as sent by the Arduino when compiled with `BINARY_PROTOCOL`
+# Note: everything is little-endian and packed, see `arduino/serial/serial.ino` for the sender side
+#  - 2 bytes: sync marker (0x5A, 0xA5)
+#  - 2 bytes: sequence number, incremented (and wrapped) for every frame
+#  - 4 bytes: Arduino timestamp, in milliseconds
+#  - 28 bytes: acceleration (m/s^2), angular velocity (rad/s) and temperature (°C), as 32-bit floats
+#  - 2 bytes: CRC-16/CCITT-FALSE of everything between sync marker and CRC
+FRAME_DTYPE = np.dtype([
+    ("sync", "<u2"),
+    ("sequence", "<u2"),
+    ("arduino_timestamp", "<u4"),
+    ("ax", "<f4"),
+    ("ay", "<f4"),
+    ("az", "<f4"),
+    ("gx", "<f4"),
+    ("gy", "<f4"),
+    ("gz", "<f4"),
+    ("temperature", "<f4"),
+    ("crc", "<u2"),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+
+# Fields sent by the firmware, in the same order in both text and binary modes
+COLUMNS = FRAME_DTYPE.names[2:-1]
+
+SYNC = 0xA55A
+SYNC_BYTES = SYNC.to_bytes(2, "little")
+
+# Binary mode is only useful if the link can sustain the sensor rate
+BINARY_BAUD_RATE = 230400
+ASCII_BAUD_RATE = 9600
+
+
+def _make_crc_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+
+CRC_TABLE = _make_crc_table()
+
+
+def crc16(data):
+    """
+    Input:
+        data: (N, K) uint8 array, one message per row
+
+    Output:
+        (N,) uint16 array, CRC-16/CCITT-FALSE of each row
+    """
+
+    # Bytes are processed column by column, so the cost does not depend on the number of rows
+    crc = np.full(data.shape[0], 0xFFFF, dtype=np.uint16)
+    for j in range(data.shape[1]):
+        index = (crc >> 8) ^ data[:, j]
+        crc = (crc << 8) ^ CRC_TABLE[index]
+    return crc
+
+
+def encode(records, first_sequence=0):
+    """
+    Input:
+        records: mapping (e.g. structured array or DataFrame) with `arduino_timestamp`, `ax`, ..., `temperature`
+        first_sequence: sequence number of the first frame
+
+    Output:
+        bytes, ready to be written to the wire
+    """
+    n = len(records["arduino_timestamp"])
+    frames = np.zeros(n, dtype=FRAME_DTYPE)
+    frames["sync"] = SYNC
+    frames["sequence"] = (first_sequence + np.arange(n)) & 0xFFFF
+    for name in COLUMNS:
+        frames[name] = records[name]
+    raw = frames.view(np.uint8).reshape(n, FRAME_SIZE)
+    frames["crc"] = crc16(raw[:, 2:-2])
+    return frames.tobytes()
+
+
+def decode(buffer):
+    """
+    Input:
+        buffer: bytes-like object, possibly starting or ending in the middle of a frame
+
+    Output:
+        frames: structured array with `FRAME_DTYPE`, only valid frames are kept
+        consumed: number of bytes that can be dropped from the front of the buffer
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    n = data.shape[0]
+    if n < FRAME_SIZE:
+        return np.zeros(0, dtype=FRAME_DTYPE), 0
+
+    # Find candidate frames, i.e. sync marker followed by enough bytes for a complete frame
+    last = n - FRAME_SIZE + 1
+    starts, = np.nonzero((data[:last] == SYNC_BYTES[0]) & (data[1:last + 1] == SYNC_BYTES[1]))
+
+    # Gather all candidates at once, and validate them using their checksum
+    raw = data[starts[:, None] + np.arange(FRAME_SIZE)]
+    crc = raw[:, -2].astype(np.uint16) | (raw[:, -1].astype(np.uint16) << 8)
+    is_valid = crc16(raw[:, 2:-2]) == crc
+    starts = starts[is_valid]
+    raw = raw[is_valid]
+
+    # A valid frame may (very rarely) contain another valid-looking frame, keep the first one
+    if starts.shape[0] > 1 and (np.diff(starts) < FRAME_SIZE).any():
+        keep = np.zeros(starts.shape[0], dtype=bool)
+        end = 0
+        for i, start in enumerate(starts):
+            if start >= end:
+                keep[i] = True
+                end = start + FRAME_SIZE
+        starts = starts[keep]
+        raw = raw[keep]
+
+    # Anything before the last complete frame, or that cannot be the start of a complete frame, is done
+    consumed = last
+    if starts.shape[0] > 0:
+        consumed = max(consumed, starts[-1] + FRAME_SIZE)
+
+    frames = np.ascontiguousarray(raw).view(FRAME_DTYPE).reshape(-1)
+    return frames, int(consumed)
+
+
+def count_lost(frames, previous_sequence=None):
+    """
+    Input:
+        frames: structured array with `FRAME_DTYPE`
+        previous_sequence: sequence number of the frame received just before, if any
+
+    Output:
+        number of frames that were lost (or corrupted) on the wire
+    """
+    sequence = frames["sequence"].astype(np.int64)
+    if previous_sequence is not None:
+        sequence = np.concatenate([[previous_sequence], sequence])
+    steps = np.diff(sequence) & 0xFFFF
+    return int((steps - 1).sum()) if steps.shape[0] > 0 else 0
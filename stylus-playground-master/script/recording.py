@@ -0,0 +1,257 @@
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from util import no_interrupt
+
+
+# Row layouts of the streams we record
+# Note: `timestamp` is the host timestamp corrected using the device clock (see `clock.py`)
+IMU_DTYPE = np.dtype([
+    ("host_timestamp", "<i8"),
+    ("arduino_timestamp", "<i4"),
+    ("ax", "<f4"),
+    ("ay", "<f4"),
+    ("az", "<f4"),
+    ("gx", "<f4"),
+    ("gy", "<f4"),
+    ("gz", "<f4"),
+    ("temperature", "<f4"),
+    ("timestamp", "<i8"),
+])
+TABLET_DTYPE = np.dtype([
+    ("host_timestamp", "<i8"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("in_range", "<f4"),
+    ("touch", "<f4"),
+    ("pressure", "<f4"),
+    ("reset", "<f4"),
+])
+
+# File layout
+#  - header: magic, version, length of JSON description, JSON description of streams, padding
+#  - blocks: raw rows, each block belongs to a single stream
+#  - index: one entry per block
+#  - footer: magic, offset of index, number of blocks
+# Note: everything is little-endian
+MAGIC = b"STYLREC\0"
+INDEX_MAGIC = b"STYLIDX\0"
+VERSION = 1
+ALIGNMENT = 64
+HEADER_STRUCT = struct.Struct("<8sII")
+FOOTER_STRUCT = struct.Struct("<8sQQ")
+INDEX_DTYPE = np.dtype([
+    ("stream", "<u4"),
+    ("rows", "<u4"),
+    ("offset", "<u8"),
+    ("first_host_timestamp", "<i8"),
+    ("last_host_timestamp", "<i8"),
+])
+
+
+def _describe(dtype):
+    return [[name, dtype[name].str] for name in dtype.names]
+
+
+class Recorder:
+    """
+    Append-only writer for one or more streams of fixed-dtype rows.
+
+    Rows are accumulated in preallocated buffers, and written as a block when either `flush_rows` rows are pending,
+    or `flush_interval` seconds elapsed since the last write. Blocks are written without interruption, and the index
+    is written on close, including when leaving the context because of a `KeyboardInterrupt`.
+    """
+
+    def __init__(self, path, streams, flush_rows=4096, flush_interval=1.0):
+        self.path = path
+        self.names = list(streams)
+        self.dtypes = [np.dtype(streams[name]) for name in self.names]
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.buffers = [np.zeros(flush_rows, dtype=dtype) for dtype in self.dtypes]
+        self.counts = [0] * len(self.names)
+        self.index = []
+        self.file = None
+        self.last_flush = None
+
+    def open(self):
+        assert self.file is None
+        self.file = open(self.path, "wb")
+
+        # Write header, padded so that blocks are aligned
+        description = {"streams": {name: _describe(dtype) for name, dtype in zip(self.names, self.dtypes)}}
+        description = json.dumps(description).encode("utf-8")
+        size = HEADER_STRUCT.size + len(description)
+        padding = -size % ALIGNMENT
+        self.file.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(description) + padding))
+        self.file.write(description + b" " * padding)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.file is None:
+            return
+        with no_interrupt():
+            self.flush()
+
+            # Write index and footer
+            offset = self.file.tell()
+            index = np.array(self.index, dtype=INDEX_DTYPE)
+            self.file.write(index.tobytes())
+            self.file.write(FOOTER_STRUCT.pack(INDEX_MAGIC, offset, len(index)))
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.close()
+
+    def append(self, stream, columns):
+        """
+        Input:
+            stream: name of the stream
+            columns: mapping from column name to values (e.g. structured array), scalars are broadcast
+        """
+        i = self.names.index(stream)
+        buffer = self.buffers[i]
+        size = max((len(columns[name]) for name in self.dtypes[i].names if np.ndim(columns[name]) > 0), default=0)
+
+        # Copy in chunks, if more rows than the buffer can hold are provided
+        done = 0
+        while done < size:
+            count = self.counts[i]
+            n = min(size - done, buffer.shape[0] - count)
+            rows = buffer[count:count + n]
+            for name in self.dtypes[i].names:
+                values = columns[name]
+                rows[name] = values[done:done + n] if np.ndim(values) > 0 else values
+            self.counts[i] += n
+            done += n
+            if self.counts[i] == buffer.shape[0]:
+                self.flush(i)
+        self.maybe_flush()
+
+    def append_row(self, stream, values):
+        """
+        Input:
+            stream: name of the stream
+            values: tuple of values, in the order of the stream columns
+        """
+        i = self.names.index(stream)
+        self.buffers[i][self.counts[i]] = values
+        self.counts[i] += 1
+        if self.counts[i] == self.buffers[i].shape[0]:
+            self.flush(i)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, stream=None):
+        indices = range(len(self.names)) if stream is None else [stream]
+        with no_interrupt():
+            for i in indices:
+                count = self.counts[i]
+                if count == 0:
+                    continue
+                rows = self.buffers[i][:count]
+                timestamps = rows["host_timestamp"] if "host_timestamp" in rows.dtype.names else [0]
+                self.index.append((i, count, self.file.tell(), timestamps[0], timestamps[-1]))
+                self.file.write(rows.tobytes())
+                self.counts[i] = 0
+            self.file.flush()
+        self.last_flush = time.monotonic()
+
+
+class Recording:
+    """
+    Read-only view of a file written by `Recorder`, backed by a memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+
+        # Parse header
+        magic, version, length = HEADER_STRUCT.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        if version > VERSION:
+            raise ValueError(f"{path} uses unsupported version {version}")
+        description = json.loads(self.data[HEADER_STRUCT.size:HEADER_STRUCT.size + length].tobytes())
+        self.names = list(description["streams"])
+        self.dtypes = [np.dtype([tuple(field) for field in fields]) for fields in description["streams"].values()]
+        self.header_size = HEADER_STRUCT.size + length
+
+        # Parse index, if the file was properly closed
+        magic = None
+        if self.data.shape[0] >= self.header_size + FOOTER_STRUCT.size:
+            magic, offset, count = FOOTER_STRUCT.unpack_from(self.data, self.data.shape[0] - FOOTER_STRUCT.size)
+        if magic == INDEX_MAGIC:
+            self.index = self.data[offset:offset + count * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+
+        # Otherwise, a single stream can still be recovered
+        elif len(self.names) == 1:
+            rows = (self.data.shape[0] - self.header_size) // self.dtypes[0].itemsize
+            self.index = np.array([(0, rows, self.header_size, 0, 0)], dtype=INDEX_DTYPE)
+        else:
+            raise ValueError(f"{path} has no index, it was probably not closed properly")
+
+    def blocks(self, stream):
+        i = self.names.index(stream)
+        dtype = self.dtypes[i]
+        for entry in self.index[self.index["stream"] == i]:
+            start = int(entry["offset"])
+            yield self.data[start:start + int(entry["rows"]) * dtype.itemsize].view(dtype)
+
+    def __getitem__(self, stream):
+        i = self.names.index(stream)
+        dtype = self.dtypes[i]
+        index = self.index[self.index["stream"] == i]
+        if index.shape[0] == 0:
+            return np.zeros(0, dtype=dtype)
+
+        # If blocks are contiguous (e.g. single stream), this is just a view on the memory map
+        starts = index["offset"].astype(np.int64)
+        ends = starts + index["rows"].astype(np.int64) * dtype.itemsize
+        if (starts[1:] == ends[:-1]).all():
+            return self.data[starts[0]:ends[-1]].view(dtype)
+
+        # Otherwise, blocks need to be concatenated
+        return np.concatenate(list(self.blocks(stream)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+
+def load(path, stream=None):
+    """
+    Input:
+        path: recording written by `Recorder`
+        stream: name of the stream, defaults to the first one
+
+    Output:
+        structured array, memory-mapped when possible
+    """
+    recording = Recording(path)
+    if stream is None:
+        stream = recording.names[0]
+    return recording[stream]
+
+
+def is_recording(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,111 @@
+import argparse
+import os
+import time
+import tty
+
+import numpy as np
+
+import loader
+import protocol
+
+
+def format_lines(data):
+    """
+    Format samples exactly as the firmware does in text mode.
+    """
+    return [
+        f"{int(t)},{ax:.4f},{ay:.4f},{az:.4f},{gx:.4f},{gy:.4f},{gz:.4f},{c:.2f}\r\n".encode("ascii")
+        for t, ax, ay, az, gx, gy, gz, c in zip(*(data[name] for name in protocol.COLUMNS))
+    ]
+
+
+def format_frames(data):
+    """
+    Format samples exactly as the firmware does in binary mode.
+    """
+    raw = protocol.encode(data)
+    return [raw[i:i + protocol.FRAME_SIZE] for i in range(0, len(raw), protocol.FRAME_SIZE)]
+
+
+def replay(fd, records, times, speed=1.0, loop=False, batch=64):
+    """
+    Input:
+        fd: file descriptor to write to (e.g. pseudo-terminal master)
+        records: list of encoded records
+        times: send time of each record, in seconds, relative to the first one
+        speed: time scaling factor, zero (or negative) means as fast as possible
+        loop: restart from the beginning when done
+        batch: number of records per write, when sending as fast as possible
+
+    Output:
+        number of records and bytes sent, and elapsed time
+    """
+    sent_records = 0
+    sent_bytes = 0
+    start = time.perf_counter()
+    while True:
+
+        # As fast as possible, just let the reader apply back pressure
+        if speed <= 0.0:
+            for i in range(0, len(records), batch):
+                data = b"".join(records[i:i + batch])
+                os.write(fd, data)
+                sent_bytes += len(data)
+            sent_records += len(records)
+
+        # Otherwise, send everything that is due, then sleep until next record
+        else:
+            origin = time.perf_counter()
+            schedule = np.asarray(times) / speed
+            i = 0
+            while i < len(records):
+                now = time.perf_counter() - origin
+                j = max(int(np.searchsorted(schedule, now, side="right")), i + 1)
+                data = b"".join(records[i:j])
+                os.write(fd, data)
+                sent_bytes += len(data)
+                sent_records += j - i
+                i = j
+                if i < len(records):
+                    delay = schedule[i] - (time.perf_counter() - origin)
+                    if delay > 0:
+                        time.sleep(delay)
+
+        if not loop:
+            break
+
+    return sent_records, sent_bytes, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    # Expect a recorded IMU dump, sent as raw sensor values (i.e. without calibration)
+    parser = argparse.ArgumentParser(description="Expose a pseudo-terminal that replays an IMU recording")
+    parser.add_argument("path", help="IMU dump or binary recording (see `loader.py`)")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scaling factor, 0 for as fast as possible")
+    parser.add_argument("--binary", action="store_true", help="send binary frames (see `protocol.py`)")
+    parser.add_argument("--loop", action="store_true", help="restart from the beginning when done")
+    parser.add_argument("--wait", type=float, default=2.0, help="delay before sending, to let consumers connect")
+    parser.add_argument("--linger", type=float, default=2.0, help="delay before closing, to let consumers drain")
+    args = parser.parse_args()
+
+    # Prepare everything upfront, to keep the sending loop cheap
+    data = loader.load(args.path, calibrate=False)
+    records = format_frames(data) if args.binary else format_lines(data)
+    times = (data["arduino_timestamp"] - data["arduino_timestamp"][0]) * 1e-3
+
+    # Raw mode, so that bytes are passed as-is
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    print(f"Replaying {len(records)} records on {os.ttyname(slave)}", flush=True)
+    time.sleep(args.wait)
+
+    try:
+        count, size, elapsed = replay(master, records, times, speed=args.speed, loop=args.loop)
+        print(f"Sent {count} records ({size} bytes) in {elapsed:.3f} s, i.e. {count / elapsed:.0f} records/s", flush=True)
+        time.sleep(args.linger)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+
+import numpy as np
+import scipy.interpolate
+
+
+# Columns of resampled segments
+COLUMNS = ("host_timestamp", "x", "y", "z", "in_range", "touch", "pressure")
+
+# Bump when the resampling itself changes, to invalidate cached results
+CACHE_VERSION = 1
+
+# Results are cached next to the recordings, like parsed CSV files (see `loader.py`)
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".cache", "resample")
+
+
+def resample_segment(columns, smoothness=200.0, step=1.0):
+    """
+    Input:
+        columns: mapping from column name to values (e.g. DataFrame) with tablet columns, for a single segment
+        smoothness: smoothing factor of the spline (see `scipy.interpolate.splprep`)
+        step: distance between resampled points, in the same unit as `x` and `y`
+
+    Output:
+        dictionary of arrays (see `COLUMNS`), sampled at regular (spatial) interval along a smoothed trace,
+        or None if the pen barely moved
+    """
+    x = np.asarray(columns["x"], dtype=np.float64)
+    y = np.asarray(columns["y"], dtype=np.float64)
+    if x.shape[0] == 0:
+        return None
+
+    # Compute distance
+    dx = np.diff(x, prepend=x[0])
+    dy = np.diff(y, prepend=y[0])
+    d = np.sqrt(dx ** 2 + dy ** 2)
+    t = np.cumsum(d)
+    length = t[-1]
+
+    # Fit cubic splines
+    mask = d > 1e-5
+    if mask.sum() <= 3:
+        return None
+    tck, _ = scipy.interpolate.splprep([x[mask], y[mask]], u=t[mask], s=smoothness)
+
+    # Sample spline at regular (spatial) interval
+    t_r = np.arange(0, length, step)
+    x_r, y_r = scipy.interpolate.splev(t_r, tck, der=0)
+    result = {"x": np.asarray(x_r), "y": np.asarray(y_r)}
+
+    # Resample other values linearly
+    for name in ["host_timestamp", "z", "in_range", "pressure"]:
+        result[name] = np.interp(t_r, t, np.asarray(columns[name], dtype=np.float64))
+
+    # Since `touch` is a boolean, use nearest neighbor instead
+    indices = np.minimum(np.searchsorted(t, t_r), t.shape[0] - 1)
+    result["touch"] = np.asarray(columns["touch"], dtype=np.float64)[indices]
+    return {name: result[name] for name in COLUMNS}
+
+
+def cache_key(columns, smoothness, step):
+    """
+    Input:
+        columns: mapping from column name to values, for a single segment
+
+    Output:
+        hexadecimal digest of segment content and resampling parameters
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((CACHE_VERSION, float(smoothness), float(step))).encode("ascii"))
+    for name in COLUMNS:
+        digest.update(name.encode("ascii"))
+        digest.update(np.ascontiguousarray(columns[name], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _load(path):
+    try:
+        data = np.load(path)
+    except (OSError, ValueError):
+        return None
+    return {name: data[name] for name in COLUMNS}
+
+
+def _save(path, result):
+
+    # Write to a temporary file first, so that a concurrent reader never sees a partial file
+    data = np.zeros(len(result["x"]), dtype=[(name, "<f8") for name in COLUMNS])
+    for name in COLUMNS:
+        data[name] = result[name]
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.save(file, data)
+    os.replace(temporary, path)
+
+
+def resample(columns, bounds, smoothness=200.0, step=1.0, cache=DEFAULT_CACHE):
+    """
+    Input:
+        columns: mapping from column name to values (e.g. merged DataFrame), for a whole session
+        bounds: (K, 2) array, start and stop index of each segment (see `pipeline.segments`)
+        smoothness: smoothing factor of the spline (see `scipy.interpolate.splprep`)
+        step: distance between resampled points
+        cache: directory where results are stored, keyed by segment content and parameters (None to disable)
+
+    Output:
+        packed: dictionary of arrays (see `COLUMNS`), all segments one after the other
+        offsets: (K + 1,) array, segment `k` is `packed[name][offsets[k]:offsets[k + 1]]` (empty if it was skipped)
+    """
+    columns = {name: np.asarray(columns[name], dtype=np.float64) for name in COLUMNS}
+    bounds = np.asarray(bounds, dtype=np.int64).reshape(-1, 2)
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+
+    # Resample each segment, unless already done with the same content and parameters
+    results = []
+    for start, stop in bounds:
+        segment = {name: values[start:stop] for name, values in columns.items()}
+        result = None
+        path = None
+        if cache is not None:
+            path = os.path.join(cache, cache_key(segment, smoothness, step) + ".npy")
+            if os.path.exists(path):
+                result = _load(path)
+        if result is None:
+            result = resample_segment(segment, smoothness, step)
+            if result is None:
+                result = {name: np.zeros(0) for name in COLUMNS}
+            if path is not None:
+                _save(path, result)
+        results.append(result)
+
+    # Pack everything in contiguous arrays
+    sizes = [len(result["x"]) for result in results]
+    offsets = np.zeros(len(results) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    packed = {name: np.empty(offsets[-1]) for name in COLUMNS}
+    for k, result in enumerate(results):
+        for name in COLUMNS:
+            packed[name][offsets[k]:offsets[k + 1]] = result[name]
+    return packed, offsets
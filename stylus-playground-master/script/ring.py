@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of rows, for one producer thread and one consumer thread.
+
+    Each side only writes its own counter (`head` for the producer, `tail` for the consumer), and data is written
+    before `head` is published, so no lock is needed. When full, new rows are dropped (and counted) rather than
+    overwriting rows that the consumer may be reading.
+    """
+
+    def __init__(self, capacity, columns, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, columns), dtype=dtype)
+        self.output = np.zeros((capacity, columns), dtype=dtype)
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def extend(self, rows):
+        """
+        Producer side, copy as many rows as possible and return how many were written.
+        """
+        head = self.head
+        count = min(len(rows), self.capacity - (head - self.tail))
+        self.dropped += len(rows) - count
+
+        # Copy in (at most) two slices, as the range may wrap around
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:count - first] = rows[first:count]
+
+        # Publish only once data is in place
+        self.head = head + count
+        return count
+
+    def push(self, row):
+        """
+        Producer side, single row.
+        """
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        self.data[head % self.capacity] = row
+        self.head = head + 1
+        return True
+
+    def drain(self, limit=None):
+        """
+        Consumer side, get all pending rows in order.
+
+        Note: the returned array is reused, it is only valid until the next call to `drain`.
+        """
+        tail = self.tail
+        count = self.head - tail
+        if limit is not None:
+            count = min(count, limit)
+
+        # Copy in (at most) two slices, as the range may wrap around
+        start = tail % self.capacity
+        first = min(count, self.capacity - start)
+        output = self.output[:count]
+        output[:first] = self.data[start:start + first]
+        output[first:] = self.data[:count - first]
+
+        # Release slots only once data was copied
+        self.tail = tail + count
+        return output
+
+
+class History:
+    """
+    Last rows of a stream, overwriting the oldest ones when full.
+
+    Every row is written twice, `capacity` apart, so that the last `n` rows are always a contiguous view.
+    """
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, columns))
+        self.head = 0
+        self.count = 0
+
+    def extend(self, rows):
+        rows = rows[-self.capacity:]
+        count = rows.shape[0]
+
+        # Copy in (at most) two slices, as the range may wrap around
+        start = self.head
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:count - first] = rows[first:]
+
+        # Mirror
+        self.data[start + self.capacity:start + self.capacity + first] = rows[:first]
+        self.data[self.capacity:self.capacity + count - first] = rows[first:]
+
+        self.head = (start + count) % self.capacity
+        self.count = min(self.count + count, self.capacity)
+
+    def last(self, n=None):
+        """
+        Output:
+            (n, columns) view, oldest row first
+        """
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self.data[end - n:end]
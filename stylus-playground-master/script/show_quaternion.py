@@ -1,3 +1,7 @@
+import sys
+
+
+
 import numpy as np
 
 
@@ -12,15 +16,19 @@ import pyrr
 
 
 
-import serial
-
 from serial.tools.list_ports import comports
 
 
 
-from ahrs.filters import Madgwick
+from fusion import Fusion
+
+from ring import History
+
+
 
-from ahrs.common.orientation import acc2q
+import frames
+
+import tracing
 
 
 
@@ -60,63 +68,75 @@ def create_from_vector(v):
 
 
 
+def create_from_quaternions(q):
+
+    # Same as `pyrr.matrix44.create_from_quaternion(pyrr.quaternion.conjugate(q[[1, 2, 3, 0]]))`, for many quaternions at once
+
+    R = np.zeros(q.shape[:-1] + (4, 4))
+
+    R[..., :3, :3] = np.swapaxes(frames.rotation_matrix(q), -1, -2)
 
+    R[..., 3, 3] = 1.0
 
-class Reader:
+    return R
 
-    def __init__(self, port):
 
-        self.port = port
 
-        self.chunks = []
 
 
+# Per-instance attributes, so that all arrows are drawn at once
 
-    def update(self):
+# Note: normal matrix is stored like the model matrix (i.e. transposed), as the inverse-transpose of its linear part
 
-        lines = []
+# (which is the linear part itself for rotations)
 
+INSTANCE_DTYPE = np.dtype([
 
+    ("model", "f4", (4, 4)),
 
-        available = self.port.in_waiting
+    ("normal", "f4", (3, 3)),
 
-        if available > 0:
+    ("color", "f4", 3),
 
-            chunk = port.read(available).decode("ascii")
+])
 
 
 
-            while "\n" in chunk:
+# Get transform from [1, 0, 0] to [0, 1, 0] and [0, 0, 1], respectively
 
-                end = chunk.index("\n") + 1
+AXES = np.stack([
 
-                self.chunks.append(chunk[:end])
+    pyrr.matrix44.create_identity(),
 
-                
+    pyrr.matrix44.create_from_z_rotation(-np.pi / 2),
 
-                line = "".join(self.chunks).rstrip()
+    pyrr.matrix44.create_from_y_rotation(np.pi / 2),
 
-                lines.append(line)
+])
 
 
 
-                self.chunks.clear()
+# Colors of navigation frame and sensor frame arrows
 
-                chunk = chunk[end:]
+NAVIGATION_COLORS = np.array([(0.5, 0.2, 0.2), (0.2, 0.5, 0.2), (0.2, 0.2, 0.5)])
 
-            
+SENSOR_COLORS = np.array([(1.0, 0.2, 0.2), (0.2, 1.0, 0.2), (0.2, 0.2, 1.0)])
 
-            self.chunks.append(chunk)
 
 
+# Past sensor frames are shown as a trail, fading over a few seconds
 
-        return lines
+TRAIL_DURATION = 2.0
 
+TRAIL_CAPACITY = 4096
 
 
 
 
-port_name = None
+
+# Port can be given as argument (e.g. pseudo-terminal from `replay.py`)
+
+port_name = sys.argv[1] if len(sys.argv) > 1 else None
 
 
 
@@ -130,11 +150,19 @@ if port_name is None:
 
 
 
-# Connect to USB device
+# Latency tracing is opt-in (see `tracing.py`)
+
+tracer = tracing.from_environment()
 
-with serial.Serial(port_name, 9600, timeout=1) as port:
+if tracer is not None:
 
-    reader = Reader(port)
+    tracer.open()
+
+
+
+# Connect to USB device, parsing and filtering happen in a background thread
+
+with Fusion(port_name, capacity=TRAIL_CAPACITY, tracer=tracer) as fusion:
 
 
 
@@ -144,6 +172,14 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
 
 
+    # Latency summary, shown in a corner when tracing
+
+    overlay = pyglet.text.Label("", x=10, y=window.height - 10, anchor_y="top", multiline=True, width=1000, font_name="Courier New", font_size=10)
+
+    last_stamp = 0.0
+
+
+
     # Create OpenGL context
 
     ctx = moderngl.create_context()
@@ -166,27 +202,39 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
 
 
+        in mat4 in_model;
+
+        in mat3 in_normal_matrix;
+
+        in vec3 in_color;
+
+
+
         out vec3 v_position;
 
         out vec3 v_normal;
 
+        out vec3 v_color;
+
 
 
         uniform mat4 projection;
 
         uniform mat4 view;      
 
-        uniform mat4 model;     
-
 
 
         void main() {
 
-            gl_Position = projection * view * model * vec4(in_position, 1.0);
+            vec4 position = in_model * vec4(in_position, 1.0);
+
+            gl_Position = projection * view * position;
+
+            v_position = position.xyz;
 
-            v_position = (model * vec4(in_position, 1.0)).xyz;
+            v_normal = in_normal_matrix * in_normal;
 
-            v_normal = (transpose(inverse(model)) * vec4(in_normal, 0.0)).xyz;
+            v_color = in_color;
 
         }
 
@@ -202,14 +250,14 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
         in vec3 v_normal;
 
+        in vec3 v_color;
+
 
 
         out vec4 color;
 
         
 
-        uniform vec3 model_color;
-
         uniform vec3 light_position;
 
         uniform vec3 light_direction;
@@ -228,7 +276,7 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
             vec3 factor = vec3(0.8, 0.7, 0.9) * ratio + 0.1;
 
-            color = vec4(factor * model_color, 1.0);
+            color = vec4(factor * v_color, 1.0);
 
         }
 
@@ -254,282 +302,284 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
     vbo_normal = ctx.buffer(normals)
 
+
+
+    # Create instance buffer, large enough for static arrows, current arrows and trail
+
+    instances = np.zeros(3 + 3 + 1 + 3 * TRAIL_CAPACITY, dtype=INSTANCE_DTYPE)
+
+    vbo_instance = ctx.buffer(reserve=instances.nbytes)
+
     vao = ctx.vertex_array(prog, [
 
         (vbo_vertex, "3f", "in_position"),
 
         (vbo_normal, "3f", "in_normal"),
 
+        (vbo_instance, "16f 9f 3f/i", "in_model", "in_normal_matrix", "in_color"),
+
     ])
 
 
 
-    # Create Madgwick filter
+    # Navigation frame arrows never change
 
-    madgwick = Madgwick()
+    instances["model"][:3] = AXES
 
-    madgwick.t = None
+    instances["normal"][:3] = AXES[:, :3, :3]
 
-    madgwick.a = np.array([0.0, 0.0, 1.0])
+    instances["color"][:3] = NAVIGATION_COLORS
 
-    madgwick.q = np.array([1.0, 0.0, 0.0, 0.0])
 
 
+    # Set uniforms that do not depend on window size
 
-    @window.event
+    prog["light_position"] = [0.0, -5.0, 2.0]
 
-    def on_resize(width, height):
+    prog["light_direction"] = [-0.5, -0.5, -1.0]
 
-        # TODO
+    prog["light_radius"] = 8.0
 
-        return pyglet.event.EVENT_HANDLED
 
 
+    # Create camera transform
 
-    @window.event
+    view_matrix = pyrr.matrix44.create_look_at(
 
-    def on_draw():
+        [2.0, 2.0, 1.0],
 
+        [0.0, 0.0, 0.0],
 
+        [0.0, 0.0, 1.0],
 
-        # Clear color and depth buffers
+    )
 
-        ctx.clear()
+    prog["view"] = view_matrix.flatten()
 
-        ctx.enable(moderngl.DEPTH_TEST | moderngl.CULL_FACE)
 
 
+    # Timestamp and quaternion of past samples
 
-        # Create perspective projection transform
+    trail = History(TRAIL_CAPACITY, 5)
 
-        # Note: `pyrr` uses transposed matrices, i.e. use `m.T @ p` to transform a point!
-
-        projection_matrix = pyrr.matrix44.create_perspective_projection(
 
-            60,
 
-            window.aspect_ratio,
+    @window.event
 
-            0.1,
+    def on_resize(width, height):
 
-            1000,
 
-        )
 
+        # Create perspective projection transform, only when needed
 
+        # Note: `pyrr` uses transposed matrices, i.e. use `m.T @ p` to transform a point!
 
-        # Create camera transform
+        projection_matrix = pyrr.matrix44.create_perspective_projection(
 
-        view_matrix = pyrr.matrix44.create_look_at(
+            60,
 
-            [2.0, 2.0, 1.0],
+            window.aspect_ratio,
 
-            [0.0, 0.0, 0.0],
+            0.1,
 
-            [0.0, 0.0, 1.0],
+            1000,
 
         )
 
 
 
-        # Get estimated quaternion, in `pyrr` format
-
-        # Note: this is the transformation from navigation frame to sensor frame
-
-        q_ns = madgwick.q[[1, 2, 3, 0]]
-
+        # Note: `pyrr` transposed format is convenient, as uniform matrices are expected row-wise
 
+        prog["projection"] = projection_matrix.flatten()
 
-        # Get transformation from sensor frame to navigation frame
+        ctx.viewport = (0, 0, *window.get_framebuffer_size())
 
-        q_sn = pyrr.quaternion.conjugate(q_ns)
+        overlay.y = height - 10
 
+        return pyglet.event.EVENT_HANDLED
 
 
-        # Get associated rotation matrix, with homogeneous coordinate
 
-        R_sn = pyrr.matrix44.create_from_quaternion(q_sn)
+    @window.event
 
+    def on_draw():
 
+        global last_stamp
 
-        # Get measured acceleration in navigation frame
 
-        a_s = madgwick.a
 
-        a_n = R_sn[:3, :3].T @ a_s
+        # Clear color and depth buffers
 
+        ctx.clear()
 
+        ctx.enable(moderngl.DEPTH_TEST | moderngl.CULL_FACE)
 
-        # Get transformation matrix for acceleration arrow
 
-        # Note: matrices must be composed from left to right (i.e. left-most is applied first)
 
-        q_a = create_from_vector(a_n)
+        # Get latest estimation, and every orientation since last frame
 
-        s_a = np.linalg.norm(a_n)
+        state = fusion.latest()
 
-        R_a = pyrr.matrix44.create_from_scale([s_a, 1.0, 1.0]) @ pyrr.matrix44.create_from_quaternion(q_a)
+        trail.extend(fusion.poses.drain())
 
 
 
-        # Get transform from [1, 0, 0] to [0, 1, 0] and [0, 0, 1], respectively
+        # A few comments on reference frames:
 
-        R_ex = pyrr.matrix44.create_identity()
+        #  - `ahrs` uses X-right, Y-forward, Z-up as body frame
 
-        R_ey = pyrr.matrix44.create_from_z_rotation(-np.pi / 2)
+        #  - We use X-forward (pen tip), Y-left, Z-up (upward w.r.t. sensor PCB, at least)
 
-        R_ez = pyrr.matrix44.create_from_y_rotation(np.pi / 2)
+        #  - Navigation frame is X-East, Y-North, Z-up (a.k.a. ENU)
 
+        #  - In our case, magnetic field is not measured, so there is not any known anchor horizontally
 
 
-        # Sensor frame arrows
 
-        x_arrow = (1.0, 0.2, 0.2), R_ex @ R_sn
+        # Get estimated quaternion, in `pyrr` format
 
-        y_arrow = (0.2, 1.0, 0.2), R_ey @ R_sn
+        # Note: this is the transformation from navigation frame to sensor frame
 
-        z_arrow = (0.2, 0.2, 1.0), R_ez @ R_sn
+        q_ns = state[[2, 3, 4, 1]]
 
 
 
-        # Navigation frame arrows
+        # Get transformation from sensor frame to navigation frame
 
-        ex_arrow = (0.5, 0.2, 0.2), R_ex
+        q_sn = pyrr.quaternion.conjugate(q_ns)
 
-        ey_arrow = (0.2, 0.5, 0.2), R_ey
 
-        ez_arrow = (0.2, 0.2, 0.5), R_ez
 
+        # Get associated rotation matrix, with homogeneous coordinate
 
+        R_sn = pyrr.matrix44.create_from_quaternion(q_sn)
 
-        # Acceleration arrow
 
-        # Note: this should roughly points up, as this is dominated by gravity
 
-        a_arrow = (1.0, 1.0, 0.2), R_a
+        # Get measured acceleration in navigation frame
 
+        a_s = state[5:8]
 
+        a_n = R_sn[:3, :3].T @ a_s
 
-        # Pack all arrows as single list, for convenience
 
-        arrows = [
 
-            ex_arrow,
+        # Get transformation matrix for acceleration arrow
 
-            ey_arrow,
+        # Note: matrices must be composed from left to right (i.e. left-most is applied first)
 
-            ez_arrow,
+        q_a = create_from_vector(a_n)
 
-            x_arrow,
+        s_a = np.linalg.norm(a_n)
 
-            y_arrow,
+        R_a = pyrr.matrix44.create_from_scale([s_a, 1.0, 1.0]) @ pyrr.matrix44.create_from_quaternion(q_a)
 
-            z_arrow,
 
-            a_arrow,
 
-        ]
+        # Past sensor frames, without the latest one (which is drawn as current sensor frame)
 
+        history = trail.last()[:-1]
 
+        age = state[0] - history[:, 0]
 
-        # Set uniforms
+        history = history[age < TRAIL_DURATION]
 
-        # Note: `pyrr` transposed format is convenient, as uniform matrices are expected row-wise
+        fade = 1.0 - age[age < TRAIL_DURATION] / TRAIL_DURATION
 
-        prog["projection"] = projection_matrix.flatten()
 
-        prog["view"] = view_matrix.flatten()
 
-        prog["light_position"] = [0.0, -5.0, 2.0]
+        # Sensor frame arrows, for current and past sensor frames
 
-        prog["light_direction"] = [-0.5, -0.5, -1.0]
+        R_sn = np.concatenate([create_from_quaternions(history[:, 1:5]), R_sn[None]])
 
-        prog["light_radius"] = 8.0
+        models = AXES[None] @ R_sn[:, None]
 
+        colors = SENSOR_COLORS[None] * np.append(0.5 * fade, 1.0)[:, None, None]
 
 
-        # Draw triangles
 
-        for color, model_matrix in arrows:
+        # Acceleration arrow
 
-            prog["model"] = model_matrix.flatten()
+        # Note: this should roughly points up, as this is dominated by gravity
 
-            prog["model_color"] = color
+        models = np.concatenate([models.reshape(-1, 4, 4), R_a[None]])
 
-            vao.render()
+        colors = np.concatenate([colors.reshape(-1, 3), [(1.0, 1.0, 0.2)]])
 
 
 
-    # This gets executed at each "frame"
+        # Pack all arrows in a single buffer
 
-    def tick(dt):
+        count = 3 + models.shape[0]
 
+        instances["model"][3:count] = models
 
+        instances["normal"][3:count - 1] = models[:-1, :3, :3]
 
-        # Handle pending input from Arduino
+        instances["normal"][count - 1] = np.linalg.inv(R_a[:3, :3]).T
 
-        lines = reader.update()
+        instances["color"][3:count] = colors
 
-        for line in lines:
+        vbo_instance.write(instances[:count])
 
-            args = line.strip().split(",")
 
-            if len(args) == 8:
 
+        # Draw triangles, for all arrows at once
 
+        vao.render(instances=count)
 
-                # A few comments on reference frames:
+        if tracer is None:
 
-                #  - `ahrs` uses X-right, Y-forward, Z-up as body frame
+            return
 
-                #  - We use X-forward (pen tip), Y-left, Z-up (upward w.r.t. sensor PCB, at least)
 
-                #  - Navigation frame is X-East, Y-North, Z-up (a.k.a. ENU)
 
-                #  - In our case, magnetic field is not measured, so there is not any known anchor horizontally
+        # Latency up to the first frame showing the latest sample
 
+        # Note: frame is presented on buffer swap, right after this
 
+        if state[8] != last_stamp:
 
-                # Parse line, convert to expected units
+            tracer.record("frame", int(state[8]))
 
-                t = int(args[0]) * 1e-3
+            last_stamp = state[8]
 
-                a = np.array([float(args[1]), float(args[2]), float(args[3])])
+        ctx.disable(moderngl.DEPTH_TEST)
 
-                g = np.array([float(args[4]), float(args[5]), float(args[6])]) * (np.pi / 180.0)
+        overlay.draw()
 
 
 
-                # If this is the first iteration, roughly estimate orientation using gravity only
+    # Refresh latency summary from time to time, as it merges histograms of all threads
 
-                if madgwick.t is None:
+    def update_overlay(dt):
 
-                    madgwick.q = acc2q(a)
+        overlay.text = tracer.text()
 
 
 
-                # Otherwise, apply Madgwick filter to update orientation estimation
+    if tracer is not None:
 
-                else:
+        pyglet.clock.schedule_interval(update_overlay, 0.5)
 
-                    madgwick.Dt = t - madgwick.t
 
-                    madgwick.q = madgwick.updateIMU(madgwick.q, g, a)
 
+    # Window is redrawn at each "frame", whatever the sensor rate
 
+    pyglet.app.run()
 
-                # Also keep latest timestamp and measured acceleration
 
-                madgwick.t = t
 
-                madgwick.a = a
+    # Show how the worker kept up
 
+    print(fusion.counters())
 
 
-    # Schedule relatively fast update
 
-    pyglet.clock.schedule_interval(tick, 0.02)
+# Write latency summary, one last time
 
+if tracer is not None:
 
+    tracer.close()
 
-    pyglet.app.run()
+    print(tracer.text())
@@ -0,0 +1,96 @@
+import pyglet
+from pyglet.gl import GL_LINES
+
+
+# Unused vertices are degenerate segments far away from the window, so they never produce any fragment
+OFFSCREEN = -1e6
+
+
+class Strokes:
+    """
+    Growable vertex buffer for pen strokes, rendered as line segments in a single draw call.
+
+    Each movement only uploads its own segment, and the buffer is doubled when full, so appending is amortized O(1)
+    and frame time does not depend on how much was drawn.
+    """
+
+    def __init__(self, batch=None, group=None, capacity=4096):
+        self.batch = batch or pyglet.graphics.Batch()
+        self.group = group
+        self.program = pyglet.graphics.get_default_shader()
+
+        # Vertices are used in pairs, one pair per segment
+        self.capacity = capacity
+        self.count = 0
+        self.vertex_list = self.program.vertex_list(
+            capacity, GL_LINES, batch=self.batch, group=group, position="f", colors="Bn"
+        )
+        self.reset_range(0, capacity)
+
+        # First vertex of each stroke, and small circle where it started
+        self.starts = []
+        self.circles = []
+
+        # Current stroke
+        self.is_drawing = False
+        self.old_x = 0
+        self.old_y = 0
+        self.color = (255, 255, 255, 255)
+
+    def set_range(self, start, count, positions, colors):
+        vertex_list = self.vertex_list
+        for name, data in [("position", positions), ("colors", colors)]:
+            attribute = vertex_list.domain.attribute_names[name]
+            attribute.set_region(attribute.buffer, vertex_list.start + start, count, data)
+
+    def reset_range(self, start, count):
+        self.set_range(start, count, (OFFSCREEN, OFFSCREEN, 0.0) * count, (0, 0, 0, 0) * count)
+
+    def reserve(self, count):
+
+        # Double capacity, so that resizing cost is amortized
+        if self.count + count > self.capacity:
+            capacity = max(2 * self.capacity, self.count + count)
+            self.vertex_list.resize(capacity)
+            self.reset_range(self.capacity, capacity - self.capacity)
+            self.capacity = capacity
+
+    def append(self, x0, y0, x1, y1, color):
+        self.reserve(2)
+        self.set_range(self.count, 2, (x0, y0, 0.0, x1, y1, 0.0), color * 2)
+        self.count += 2
+
+    def begin(self, x, y, color=None):
+        self.end()
+        self.is_drawing = True
+        self.old_x = x
+        self.old_y = y
+        if color is not None:
+            self.color = color
+        self.starts.append(self.count)
+        circle = pyglet.shapes.Circle(x, y, 5, color=self.color, batch=self.batch, group=self.group)
+        self.circles.append(circle)
+
+    def update(self, x, y):
+
+        # Only draw a line if there was a change
+        if self.is_drawing and (self.old_x != x or self.old_y != y):
+            self.append(self.old_x, self.old_y, x, y, self.color)
+        self.old_x = x
+        self.old_y = y
+
+    def end(self):
+        self.is_drawing = False
+
+    def clear(self):
+        self.end()
+
+        # Keep storage, only hide what was drawn
+        self.reset_range(0, self.count)
+        self.count = 0
+        self.starts.clear()
+        self.circles.clear()
+
+    def delete(self):
+        self.clear()
+        self.vertex_list.delete()
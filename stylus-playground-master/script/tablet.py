@@ -0,0 +1,155 @@
+import numpy as np
+
+import pyglet
+
+from recording import TABLET_DTYPE
+
+
+# Raw names of the controls we need, as reported by the driver in each supported language
+# Note: see `WacomInDesiredLanguage.bat` to change driver language
+CONTROL_NAMES = {
+    "x": ("X Axis", "X-Achse"),
+    "y": ("Y Axis", "Y-Achse"),
+    "z": ("Z Axis", "Z-Achse"),
+    "in_range": ("In Range", "Im Bereich"),
+    "touch": ("Tip Switch", "Tippschalter"),
+    "pressure": ("Tip Pressure", "Druckempfindliche Spitze"),
+}
+
+# Events are identified by the index of the associated column (after `host_timestamp`)
+EVENT_COLUMNS = TABLET_DTYPE.names[1:]
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_COLUMNS)}
+EVENT_DTYPE = np.dtype([
+    ("host_timestamp", "<i8"),
+    ("control", "<u1"),
+    ("value", "<f8"),
+])
+
+
+def find_tablet(name="Wacom Tablet"):
+    """
+    Output:
+        device: pyglet device of the tablet (not opened yet)
+        controls: dictionary of controls, with the same keys as `CONTROL_NAMES`
+    """
+
+    # Enumerate input devices
+    # TODO pyglet's tablet objects seem to provide less details, but I may be wrong...
+    for device in pyglet.input.get_devices():
+
+        # Search by name
+        if device.name == name:
+
+            # The tablet appears twice, we need the one that has more information
+            # TODO better way to check for that?
+            controls = device.get_controls()
+            if len(controls) == 17:
+                break
+
+    else:
+        raise RuntimeError("Wacom tablet not found")
+
+    # Resolve names, whatever the language
+    control_map = {control.raw_name: control for control in controls}
+    result = {}
+    for key, names in CONTROL_NAMES.items():
+        for raw_name in names:
+            if raw_name in control_map:
+                result[key] = control_map[raw_name]
+                break
+        else:
+            raise RuntimeError(f"Control {key} not found, available controls are {list(control_map)}")
+    return device, result
+
+
+def to_window(window, x, y):
+    """
+    Convert normalized screen coordinates (i.e. both X and Y are in [0, 65535]) to window coordinates.
+
+    Note: make sure to enable Force Proportion in Wacom Tablet Properties!
+    """
+    window_x, window_y = window.get_location()
+    window_width, window_height = window.size
+    screen_width = window.screen.width
+    screen_height = window.screen.height
+    true_x = x / 65535 * screen_width - window_x
+    true_y = window_height - y / 65535 * screen_height + window_y
+    return true_x, true_y
+
+
+class EventLog:
+    """
+    Growable, preallocated log of control changes, each with its own timestamp.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, name, value, timestamp):
+        if self.count == self.events.shape[0]:
+            events = np.zeros(2 * self.count, dtype=EVENT_DTYPE)
+            events[:self.count] = self.events
+            self.events = events
+        self.events[self.count] = (timestamp, EVENT_CODES[name], value)
+        self.count += 1
+
+    def view(self, start=0):
+        return self.events[start:self.count]
+
+    def clear(self):
+
+        # Keep storage, it will most likely be needed again
+        self.count = 0
+
+
+def states(events, initial=None):
+    """
+    Input:
+        events: structured array with `EVENT_DTYPE`
+        initial: state before the first event, as a `TABLET_DTYPE` row (defaults to zero)
+
+    Output:
+        structured array with `TABLET_DTYPE`, state right after each event
+    """
+    n = events.shape[0]
+    result = np.zeros(n, dtype=TABLET_DTYPE)
+    result["host_timestamp"] = events["host_timestamp"]
+    indices = np.arange(n)
+    for code, name in enumerate(EVENT_COLUMNS):
+
+        # Forward-fill the latest value of each control
+        is_control = events["control"] == code
+        last = np.maximum.accumulate(np.where(is_control, indices, -1))
+        default = 0.0 if initial is None else initial[name]
+        result[name] = np.where(last >= 0, events["value"][np.maximum(last, 0)], default)
+
+    # Reset is an impulse, not a level
+    result["reset"] = events["control"] == EVENT_CODES["reset"]
+    return result
+
+
+def resample(states, timestamps):
+    """
+    Input:
+        states: structured array with `TABLET_DTYPE`, as returned by `states`
+        timestamps: sorted host timestamps, in nanoseconds
+
+    Output:
+        structured array with `TABLET_DTYPE`, state at each timestamp (i.e. same as polling at these instants)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    indices = np.searchsorted(states["host_timestamp"], timestamps, side="right") - 1
+    result = np.zeros(timestamps.shape[0], dtype=TABLET_DTYPE)
+    is_valid = indices >= 0
+    result[is_valid] = states[indices[is_valid]]
+    result["host_timestamp"] = timestamps
+
+    # Report each reset once, at the first sample after it happened
+    resets = np.cumsum(states["reset"] > 0)
+    count = np.where(is_valid, resets[np.maximum(indices, 0)], 0)
+    result["reset"] = np.diff(count, prepend=0) > 0
+    return result
@@ -1,6 +1,7 @@
 
 
 from collections import deque
+import sys
 
 import numpy as np
 
@@ -10,7 +11,8 @@ import serial
 from serial.tools.list_ports import comports
 
 
-port_name = None
+# Port can be given as argument (e.g. pseudo-terminal from `replay.py`)
+port_name = sys.argv[1] if len(sys.argv) > 1 else None
 
 # If none is provided, just take the first one
 if port_name is None:
@@ -3,32 +3,7 @@ from serial.tools.list_ports import comports
 
 import pyglet
 
-
-class Reader:
-    def __init__(self, port):
-        self.port = port
-        self.chunks = []
-
-    def update(self):
-        lines = []
-
-        available = self.port.in_waiting
-        if available > 0:
-            chunk = port.read(available).decode("ascii")
-
-            while "\n" in chunk:
-                end = chunk.index("\n") + 1
-                self.chunks.append(chunk[:end])
-                
-                line = "".join(self.chunks).rstrip()
-                lines.append(line)
-
-                self.chunks.clear()
-                chunk = chunk[end:]
-            
-            self.chunks.append(chunk)
-
-        return lines
+from framer import Framer
 
 
 port_name = None
@@ -40,7 +15,7 @@ if port_name is None:
 
 
 with serial.Serial(port_name, 9600, timeout=1) as port:
-    reader = Reader(port)
+    framer = Framer(8)
 
 
     window = pyglet.window.Window(1020, 576)
@@ -50,9 +25,9 @@ with serial.Serial(port_name, 9600, timeout=1) as port:
 
 
     def tick(dt):
-        lines = reader.update()
-        for line in lines:
-            print(line)
+        framer.read(port)
+        for line in framer.pop().tobytes().splitlines():
+            print(line.decode("ascii"))
 
     pyglet.clock.schedule_interval(tick, 0.1)
 
@@ -3,6 +3,8 @@ import time
 import serial
 from serial.tools.list_ports import comports
 
+from framer import Framer
+
 
 port_name = None
 
@@ -14,24 +16,13 @@ if port_name is None:
 
 with serial.Serial(port_name, 9600, timeout=1) as port:
 
-    chunks = []
+    framer = Framer(8)
 
     while True:
         
-        available = port.in_waiting
-        if available > 0:
-            chunk = port.read(available).decode("ascii")
-            
-            while "\n" in chunk:
-                end = chunk.index("\n") + 1
-                chunks.append(chunk[:end])
-                
-                line = "".join(chunks).rstrip()
-                print(line)
-
-                chunks.clear()
-                chunk = chunk[end:]
-            
-            chunks.append(chunk)
+        # Split all complete lines at once
+        framer.read(port)
+        for line in framer.pop().tobytes().splitlines():
+            print(line.decode("ascii"))
 
         time.sleep(0.1)
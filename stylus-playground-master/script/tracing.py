@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Tracing is opt-in, by setting `STYLUS_TRACE` to the output file (e.g. `STYLUS_TRACE=trace.jsonl`)
+# Note: all stamps are `time.perf_counter_ns`, which is shared by all threads
+ENVIRONMENT_VARIABLE = "STYLUS_TRACE"
+
+# Latencies are measured from the serial read that received a sample, up to each stage
+STAGES = ("parse", "filter", "frame")
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative integers (e.g. nanoseconds), in the spirit of HdrHistogram.
+
+    Values below `2 ** precision` have their own bucket, above that each power of two is split in
+    `2 ** (precision - 1)` buckets, so the relative error is below `2 ** (1 - precision)`.
+    """
+
+    def __init__(self, precision=7, max_shift=40):
+        self.precision = precision
+        self.half = 1 << (precision - 1)
+        self.counts = np.zeros((max_shift + 2) * self.half, dtype=np.int64)
+        self.total = 0
+        self.maximum = 0
+
+    def index(self, value):
+        shift = max(int(value).bit_length() - self.precision, 0)
+        return min(shift * self.half + (int(value) >> shift), self.counts.shape[0] - 1)
+
+    def lower_bound(self, index):
+        index = np.asarray(index, dtype=np.int64)
+        shift = np.maximum(index // self.half - 1, 0)
+        return (index - shift * self.half) << shift
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        self.counts[self.index(value)] += count
+        self.total += value * count
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def percentile(self, p):
+        cumulative = np.cumsum(self.counts)
+        if cumulative[-1] == 0:
+            return 0
+        index = int(np.searchsorted(cumulative, p / 100.0 * cumulative[-1]))
+        return int(self.lower_bound(index))
+
+    def summary(self, unit=1e-6):
+        """
+        Output:
+            dictionary with count, mean, percentiles and maximum (in milliseconds, by default)
+        """
+        count = int(self.counts.sum())
+        return {
+            "count": count,
+            "mean": self.total / count * unit if count > 0 else 0.0,
+            "p50": self.percentile(50) * unit,
+            "p90": self.percentile(90) * unit,
+            "p99": self.percentile(99) * unit,
+            "max": self.maximum * unit,
+        }
+
+
+class Tracer:
+    """
+    Collect latencies from several threads, without locks.
+
+    Each thread records into its own histograms, which are only merged when exporting.
+    """
+
+    def __init__(self, path=None, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.local = threading.local()
+        self.histograms = []
+        self.abort = threading.Event()
+        self.thread = None
+
+    def histogram(self, stage):
+        histograms = getattr(self.local, "histograms", None)
+        if histograms is None:
+            histograms = self.local.histograms = {}
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = Histogram()
+
+            # Appending to a list is atomic, other threads may only miss it until next snapshot
+            self.histograms.append((stage, histogram))
+        return histogram
+
+    def record(self, stage, start, count=1, now=None):
+        """
+        Input:
+            stage: stage name (see `STAGES`)
+            start: stamp of the serial read, in nanoseconds
+            count: number of samples that share this stamp
+            now: stamp of the stage, defaults to current time
+        """
+        if now is None:
+            now = time.perf_counter_ns()
+        self.histogram(stage).record(now - start, count)
+
+    def snapshot(self):
+        """
+        Output:
+            dictionary from stage name to summary (see `Histogram.summary`)
+        """
+        merged = {}
+        for stage, histogram in list(self.histograms):
+            if stage not in merged:
+                merged[stage] = Histogram()
+            merged[stage].merge(histogram)
+        return {stage: histogram.summary() for stage, histogram in merged.items()}
+
+    def text(self):
+        lines = []
+        for stage, summary in self.snapshot().items():
+            lines.append(f"{stage:<6} p50 {summary['p50']:6.1f} ms  p99 {summary['p99']:6.1f} ms  (n={summary['count']})")
+        return "\n".join(lines)
+
+    def export(self):
+        if self.path is None:
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"time": time.time(), "stages": self.snapshot()}) + "\n")
+
+    def run(self):
+        while not self.abort.wait(self.interval):
+            self.export()
+
+    def open(self):
+        assert self.thread is None
+        self.abort.clear()
+        self.thread = threading.Thread(target=self.run, name="Tracer", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.abort.set()
+        self.thread.join()
+        self.thread = None
+        self.export()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        self.close()
+
+
+def from_environment():
+    """
+    Output:
+        `Tracer` writing to the file given by `STYLUS_TRACE`, or None if tracing is disabled
+    """
+    path = os.environ.get(ENVIRONMENT_VARIABLE)
+    return Tracer(path) if path else None
@@ -1,5 +1,6 @@
 import argparse
 import logging
+import time
 
 import numpy as np
 
@@ -21,15 +22,26 @@ from panda3d.core import (
     loadPrcFileData,
 )
 
+import calibration
+import tracing
+from framer import Framer
+from fusion import Filter
+from ring import RingBuffer
+
 
 # Run serial port management in background thread
+# Note: samples are handed to the render loop through a ring buffer, to avoid touching the scene from this thread
 class IMU:
-    def __init__(self, port, on_event=None):
+    def __init__(self, port, capacity=4096, tracer=None):
         self.port = port
-        self.on_event = on_event
         self.abort = False
         self.thread = None
-        self.event = 0, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)
+        self.framer = Framer(8)
+        self.calibration = calibration.load()
+        self.tracer = tracer
+
+        # Arduino timestamp, acceleration, angular velocity, and host timestamp of the serial read (see `tracing.py`)
+        self.ring = RingBuffer(capacity, 8)
 
     def open(self):
         assert self.thread is None
@@ -45,28 +57,28 @@ class IMU:
     def run(self):
         
         # Connect to serial device
-        with serial.Serial(args.port, 9600, timeout=1) as port:
-        
-            # Drop first line, in case it was partially read before
-            port.readline()
+        with serial.Serial(self.port, 9600, timeout=1) as port:
             
             # Loop until the end
+            # Note: partial first line is dropped by the framer
             while not self.abort:
-                line = port.readline().decode("ascii")
-                
-                t, ax, ay, az, gx, gy, gz, _ = line.rstrip().split(",")
-                t = int(t)
-                a = float(ax), float(ay), float(az)
-                g = float(gx), float(gy), float(gz)
-                
-                a = np.array(a)
-                g = np.array(g)
-                
-                self.event = t, a, g
-                
-                on_event = self.on_event
-                if on_event is not None:
-                    on_event(t, a, g)
+
+                # Read directly into the framer, or wait for at least one byte
+                if self.framer.read(port) == 0:
+                    self.framer.feed(port.read(1))
+                stamp = time.perf_counter_ns()
+
+                # Parse all complete lines at once
+                records = self.framer.parse(self.framer.pop())
+                if self.tracer is not None and records.shape[0] > 0:
+                    self.tracer.record("parse", stamp, records.shape[0])
+
+                # Correct both sensors in place, acceleration is then in g
+                self.calibration.apply(records[:, 1:7], out=records[:, 1:7])
+
+                # Reuse temperature column for the stamp, and write in place, without temporary allocation
+                records[:, 7] = stamp
+                self.ring.extend(records)
 
     def __enter__(self):
         self.open()
@@ -77,8 +89,13 @@ class IMU:
 
 
 class Viewer(ShowBase):
-    def __init__(self):
+    def __init__(self, tracer=None):
         super().__init__(self)
+        self.tracer = tracer
+        self.stamp = None
+
+        # Orientation is estimated here, once per frame, over all samples received meanwhile (gyroscope is in rad/s)
+        self.filter = Filter(gyro_scale=1.0)
 
         # Add ground plane
         plane = self.loader.loadModel("../data/square.obj")
@@ -108,6 +125,22 @@ class Viewer(ShowBase):
             frameColor=(0, 0, 0, 0),
         )
 
+        # Latency summary, refreshed from time to time (see `tracing.py`)
+        if tracer is not None:
+            self.overlay = DirectLabel(
+                text="",
+                pos=(-1.7, 0, 0.9),
+                scale=0.04,
+                text_align=TextNode.ALeft,
+                text_font=font,
+                text_fg=(1, 1, 1, 1),
+                frameColor=(0, 0, 0, 0),
+            )
+            self.taskMgr.doMethodLater(0.5, self.update_overlay, "Overlay")
+
+            # Runs after the frame is rendered (i.e. after `igLoop`, which has sort 50)
+            self.taskMgr.add(self.trace_frame, "Trace", sort=55)
+
         # A simple spotlight
         spotlight = Spotlight("Spotlight")
         spotlight.setColorTemperature(6000)
@@ -182,7 +215,38 @@ class Viewer(ShowBase):
         transform = TransformState.makeMat(matrix)
         arrow.setTransform(transform)
 
-    def on_event(self, t, a, g):
+    def update(self, ring, task):
+
+        # Handle every sample received since last frame, from the main thread
+        samples = ring.drain()
+        if samples.shape[0] == 0:
+            return task.cont
+
+        # Run the filter over the whole batch, but only show the latest state
+        q = self.filter.update(samples[:, 0] * 1e-3, samples[:, 1:4], samples[:, 4:7])
+        self.on_frame(samples[-1, 0], q[-1], samples[-1, 1:4])
+        self.stamp = int(samples[-1, 7])
+        return task.cont
+
+    def trace_frame(self, task):
+
+        # Latency up to the first frame showing the latest sample
+        if self.stamp is not None:
+            self.tracer.record("frame", self.stamp)
+            self.stamp = None
+        return task.cont
+
+    def update_overlay(self, task):
+        self.overlay["text"] = self.tracer.text()
+        return task.again
+
+    def on_frame(self, t, q, a):
+        """
+        Input:
+            t: Arduino timestamp, in milliseconds
+            q: quaternion (w, x, y, z)
+            a: acceleration, in g
+        """
 
         # Show time
         t /= 1000.0
@@ -197,13 +261,11 @@ class Viewer(ShowBase):
         p = (0.0, 0.0, 1.0)
         
         # Update orientation
-        # TODO get quaternion somehow
-        q = (1.0, 0.0, 0.0, 0.0)
         self.ax.setQuat(LQuaternion(*q))
 
         # Update acceleration vector
-        # Note: scaling the force, to avoid large arrow
-        self.update_arrow(self.acc, a / 10.0)
+        # Note: acceleration is in g, so gravity is a unit arrow
+        self.update_arrow(self.acc, a)
 
 
 if __name__ == "__main__":
@@ -229,7 +291,18 @@ if __name__ == "__main__":
         info = comports()[0]
         args.port = info.device
 
+    # Latency tracing is opt-in (see `tracing.py`)
+    tracer = tracing.from_environment()
+    if tracer is not None:
+        tracer.open()
+
     # Run app
-    viewer = Viewer()
-    with IMU(args.port, viewer.on_event) as imu:
-        viewer.run()
+    # Note: `run` exits the process when the window is closed, so export the last summary on the way out
+    viewer = Viewer(tracer)
+    try:
+        with IMU(args.port, tracer=tracer) as imu:
+            viewer.taskMgr.add(viewer.update, "IMU", extraArgs=[imu.ring], appendTask=True)
+            viewer.run()
+    finally:
+        if tracer is not None:
+            tracer.close()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Scripts are flat modules, imported the same way as when running them from `script/`
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_DIRECTORY = os.path.join(ROOT, "data")
+sys.path.insert(0, os.path.join(ROOT, "script"))
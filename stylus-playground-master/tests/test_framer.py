@@ -0,0 +1,36 @@
+import numpy as np
+
+from framer import Framer
+
+
+def make_lines(n):
+    values = np.arange(n * 3, dtype=np.float64).reshape(n, 3) / 4
+    return values, b"".join(f"{a},{b},{c}\r\n".encode("ascii") for a, b, c in values)
+
+
+def test_chunks():
+    values, data = make_lines(200)
+
+    # Same records, whatever the chunk size (first record is dropped, as it may be partial)
+    for chunk in [1, 5, 64, len(data)]:
+        framer = Framer(3, capacity=16)
+        received = []
+        for i in range(0, len(data), chunk):
+            framer.feed(data[i:i + chunk])
+            received.append(framer.parse(framer.pop()).copy())
+        np.testing.assert_array_equal(np.concatenate(received), values[1:])
+
+
+def test_partial_first_record():
+    framer = Framer(3)
+    framer.feed(b".5,6\r\n1,2,3\r\n4,5")
+    np.testing.assert_array_equal(framer.parse(framer.pop()), [[1, 2, 3]])
+    framer.feed(b",6\r\n")
+    np.testing.assert_array_equal(framer.parse(framer.pop()), [[4, 5, 6]])
+
+
+def test_malformed_records():
+    framer = Framer(3, skip_first=False)
+    framer.feed(b"1,2,3\r\n4,x,6\r\n7,8\r\n9,10,11\r\n\xff\xfe\r\n12,13,14\r\n")
+    np.testing.assert_array_equal(framer.parse(framer.pop()), [[1, 2, 3], [9, 10, 11], [12, 13, 14]])
+    assert framer.dropped == 3
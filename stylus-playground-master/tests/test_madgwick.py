@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import madgwick
+
+ahrs = pytest.importorskip("ahrs")
+
+
+def make_signals(n, seed=0):
+    rng = np.random.default_rng(seed)
+    gyr = rng.normal(0.0, 0.5, (n, 3))
+    acc = rng.normal(0.0, 0.1, (n, 3)) + [0.0, 0.0, 1.0]
+    dt = rng.uniform(0.005, 0.015, n)
+
+    # Samples without rotation are left as is
+    gyr[::17] = 0.0
+    return gyr, acc, dt
+
+
+def reference(gyr, acc, dt, q0):
+    madgwick_filter = ahrs.filters.Madgwick(gain=madgwick.DEFAULT_GAIN)
+    q = np.empty((gyr.shape[0], 4))
+    q[0] = q0
+    for i in range(1, gyr.shape[0]):
+        q[i] = madgwick_filter.updateIMU(q[i - 1], gyr[i], acc[i], dt=dt[i])
+    return q
+
+
+def test_acc2q():
+    acc = make_signals(20)[1]
+    expected = np.stack([ahrs.common.orientation.acc2q(a) for a in acc])
+    np.testing.assert_allclose(madgwick.acc2q(acc), expected, atol=1e-12)
+
+
+def test_estimate():
+    gyr, acc, dt = make_signals(2000)
+    q = madgwick.estimate(gyr, acc, dt)
+    np.testing.assert_allclose(q, reference(gyr, acc, dt, madgwick.acc2q(acc[0])), atol=1e-12)
+
+
+def test_batches():
+    signals = [make_signals(300, seed) for seed in range(madgwick.SCALAR_BATCH_SIZE + 1)]
+    gyr, acc, dt = (np.stack(values) for values in zip(*signals))
+    expected = np.stack([madgwick.estimate(*values) for values in signals])
+
+    # Both small batches (one segment at a time) and large ones (vectorized over segments) match
+    np.testing.assert_allclose(madgwick.estimate(gyr, acc, dt), expected, atol=1e-12)
+    np.testing.assert_allclose(madgwick.estimate(gyr[:2], acc[:2], dt[:2]), expected[:2], atol=1e-12)
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import clock
+import merge
+from conftest import DATA_DIRECTORY
+
+
+def read_pair():
+    imu = pd.read_csv(os.path.join(DATA_DIRECTORY, "sync_imu.csv"), encoding="utf-16")
+    tablet = pd.read_csv(os.path.join(DATA_DIRECTORY, "sync_tab.csv"))
+    return imu, tablet
+
+
+def read_rows():
+    imu, tablet = read_pair()
+    imu = merge._to_rows(imu, merge.IMU_DTYPE)
+    imu["timestamp"] = clock.synchronize(imu["arduino_timestamp"], imu["host_timestamp"])
+    return imu, merge._to_rows(tablet, merge.TABLET_DTYPE)
+
+
+def merge_data(imu, tab, key="timestamp"):
+
+    # Reference, as in `data_processing.ipynb`, but on the corrected IMU clock
+    left = max(tab["host_timestamp"].iloc[0], imu[key].iloc[0])
+    right = min(tab["host_timestamp"].iloc[-1], imu[key].iloc[-1])
+    df = imu[(imu[key] >= left) & (imu[key] <= right)].copy()
+    for column in ["x", "y", "z", "in_range", "touch", "pressure"]:
+        df[column] = np.interp(df[key], tab["host_timestamp"], tab[column])
+    return df
+
+
+def test_merge_dataframes():
+    imu, tablet = read_pair()
+    merged = merge.merge(imu, tablet)
+
+    # Missing corrected timestamps are estimated, as in `loader.read_csv`, and used to join
+    imu["timestamp"] = clock.synchronize(imu["arduino_timestamp"].values, imu["host_timestamp"].values)
+    expected = merge_data(imu, tablet)
+    assert merged.shape[0] == expected.shape[0]
+    np.testing.assert_array_equal(merged["timestamp"], expected["timestamp"])
+    np.testing.assert_array_equal(merged["host_timestamp"], expected["host_timestamp"])
+    for name in ["x", "y", "z", "in_range", "pressure"]:
+        np.testing.assert_allclose(merged[name], expected[name], rtol=1e-6, atol=1e-4)
+
+
+def test_merger_keys():
+    imu, tablet = read_pair()
+
+    # Join keys are chosen per stream, e.g. host timestamps on both sides as in the notebook
+    merger = merge.Merger(imu_key="host_timestamp", horizon=None)
+    merger.push_tablet(tablet)
+    merged = merger.push_imu(imu)
+    expected = merge_data(imu, tablet, key="host_timestamp")
+    np.testing.assert_array_equal(merged["host_timestamp"], expected["host_timestamp"])
+    np.testing.assert_allclose(merged["x"], expected["x"], rtol=1e-6, atol=1e-4)
+
+
+def test_merger_chunks():
+    imu, tablet = read_rows()
+    expected = merge.merge(imu, tablet)
+
+    # Same rows, whatever the order of arrival
+    merger = merge.Merger(horizon=None)
+    results = []
+    i = j = 0
+    rng = np.random.default_rng(0)
+    while i < imu.shape[0] or j < tablet.shape[0]:
+        if j == tablet.shape[0] or (i < imu.shape[0] and rng.random() < 0.5):
+            count = rng.integers(1, 50)
+            results.append(merger.push_imu(imu[i:i + count]))
+            i += count
+        else:
+            count = rng.integers(1, 10)
+            results.append(merger.push_tablet(tablet[j:j + count]))
+            j += count
+    result = np.concatenate(results)
+    for name in merge.MERGED_DTYPE.names:
+        np.testing.assert_array_equal(result[name], expected[name])
+
+
+def test_merger_without_tablet():
+    imu, _ = read_rows()
+
+    # Rows are emitted once they are older than the horizon, and pending rows stay bounded
+    horizon = 100_000_000
+    merger = merge.Merger(horizon=horizon)
+    results = [merger.push_imu(imu[i:i + 20]) for i in range(0, imu.shape[0], 20)]
+    result = np.concatenate(results)
+    pending = merger.imu.view()
+    assert result.shape[0] + pending.shape[0] == imu.shape[0]
+    assert pending[-1]["timestamp"] - pending[0]["timestamp"] <= horizon
+    assert np.isnan(result["x"]).all()
+    assert (result["reset"] == 0).all()
@@ -0,0 +1,60 @@
+import numpy as np
+
+import protocol
+
+
+def make_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    records = {name: rng.normal(size=n).astype(np.float32) for name in protocol.COLUMNS}
+    records["arduino_timestamp"] = np.arange(n, dtype=np.uint32) * 10 + 1000
+    return records
+
+
+def test_crc16_check_value():
+
+    # Standard check value of CRC-16/CCITT-FALSE
+    data = np.frombuffer(b"123456789", dtype=np.uint8)[None]
+    assert protocol.crc16(data)[0] == 0x29B1
+
+
+def test_round_trip():
+    records = make_records(100)
+    frames, consumed = protocol.decode(protocol.encode(records, first_sequence=65500))
+    assert consumed == 100 * protocol.FRAME_SIZE
+    assert frames.shape[0] == 100
+    for name in protocol.COLUMNS:
+        np.testing.assert_array_equal(frames[name], records[name])
+    assert protocol.count_lost(frames) == 0
+
+
+def test_resynchronization():
+    raw = bytearray(protocol.encode(make_records(10)))
+
+    # Garbage before the first frame, a corrupted frame, and a partial frame at the end
+    raw[3 * protocol.FRAME_SIZE + 10] ^= 0xFF
+    buffer = b"\x5a\x00\x13" + bytes(raw) + raw[:protocol.FRAME_SIZE // 2]
+    frames, consumed = protocol.decode(buffer)
+    assert frames["sequence"].tolist() == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert protocol.count_lost(frames) == 1
+
+    # Partial frame is kept for next call
+    assert consumed == len(buffer) - protocol.FRAME_SIZE // 2
+    frames, _ = protocol.decode(buffer[consumed:] + raw[protocol.FRAME_SIZE // 2:protocol.FRAME_SIZE])
+    assert frames["sequence"].tolist() == [0]
+
+
+def test_chunks():
+    records = make_records(50)
+    raw = protocol.encode(records)
+
+    # Same frames, whatever the chunk size
+    for chunk in [1, 7, protocol.FRAME_SIZE, 100]:
+        buffer = bytearray()
+        received = []
+        for i in range(0, len(raw), chunk):
+            buffer += raw[i:i + chunk]
+            frames, consumed = protocol.decode(buffer)
+            del buffer[:consumed]
+            received.append(frames)
+        received = np.concatenate(received)
+        np.testing.assert_array_equal(received["arduino_timestamp"], records["arduino_timestamp"])
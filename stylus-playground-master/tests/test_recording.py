@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from recording import IMU_DTYPE, TABLET_DTYPE, Recorder, Recording
+
+
+def make_rows(dtype, n, start=0):
+    rows = np.zeros(n, dtype=dtype)
+    for i, name in enumerate(dtype.names):
+        rows[name] = np.arange(start, start + n) * (i + 1)
+    return rows
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "session.rec"
+    imu = make_rows(IMU_DTYPE, 1000)
+    tablet = make_rows(TABLET_DTYPE, 300)
+
+    # Interleaved blocks of both streams, row by row and in bulk
+    with Recorder(path, {"imu": IMU_DTYPE, "tablet": TABLET_DTYPE}, flush_rows=64) as recorder:
+        for i in range(0, 1000, 100):
+            recorder.append("imu", imu[i:i + 100])
+            recorder.append("tablet", tablet[i // 100 * 30:(i // 100 + 1) * 30])
+        recorder.append_row("tablet", tuple(make_rows(TABLET_DTYPE, 1, 300)[0]))
+
+    recording = Recording(path)
+    assert list(recording) == ["imu", "tablet"]
+    np.testing.assert_array_equal(recording["imu"], imu)
+    np.testing.assert_array_equal(recording["tablet"], make_rows(TABLET_DTYPE, 301))
+
+
+def test_truncated_single_stream(tmp_path):
+    path = tmp_path / "imu.rec"
+    imu = make_rows(IMU_DTYPE, 500)
+
+    # Without index (e.g. process killed), complete rows of a single stream are recovered
+    recorder = Recorder(path, {"imu": IMU_DTYPE}, flush_rows=128)
+    recorder.open()
+    recorder.append("imu", imu)
+    recorder.flush()
+    recorder.file.close()
+    with open(path, "ab") as file:
+        file.write(b"\x00" * (IMU_DTYPE.itemsize // 2))
+    np.testing.assert_array_equal(Recording(path)["imu"], imu)
+
+
+def test_truncated_several_streams(tmp_path):
+    path = tmp_path / "session.rec"
+    recorder = Recorder(path, {"imu": IMU_DTYPE, "tablet": TABLET_DTYPE})
+    recorder.open()
+    recorder.append("imu", make_rows(IMU_DTYPE, 10))
+    recorder.flush()
+    recorder.file.close()
+    with pytest.raises(ValueError):
+        Recording(path)